@@ -0,0 +1,262 @@
+"""
+Command line entry point for the pipeline.
+
+Each subcommand only imports the libraries it needs, so light jobs such as
+scoring do not pay for shap, Basemap, seaborn or imblearn at startup.
+
+Usage:
+    python cli.py prep
+    python cli.py visualize [--no-stack-plots]
+    python cli.py train [--engine forest|boosting] [--n-estimators N] [--model PATH]
+    python cli.py train --out-of-core [--engine forest|sgd] [--chunksize N]
+    python cli.py evaluate [--folds K]
+    python cli.py score --input records.csv [--output scores.csv] [--explain N]
+    python cli.py explain
+    python cli.py compact [--max-depth N] [--min-samples-leaf N] [--top-trees N] [--distill] [--no-float32]
+    python cli.py refresh [--strategy warm_start|window]
+    python cli.py profile [--output profile.json|profile.parquet]
+"""
+
+import argparse
+import os
+
+from constants import *
+
+
+def pipeline_from_args(args):
+    from new_analysis import build_pipeline
+
+    return build_pipeline(file_path=args.dataset, stack_plots=args.stack_plots, test_size=args.test_size,
+                          random_state=args.random_state, n_estimators=args.n_estimators, engine=args.engine,
+                          max_iter=args.max_iter, learning_rate=args.learning_rate,
+                          early_stopping=args.early_stopping)
+
+
+def run_prep(args):
+    pipeline_from_args(args).run(["encode", "matrix", "cube", "hotspots"])
+
+
+def run_visualize(args):
+    pipeline_from_args(args).run(["visualize"])
+
+
+def run_train(args):
+    from model import save_model
+
+    if args.out_of_core:
+        from out_of_core import train_out_of_core
+
+        model, confusion = train_out_of_core(file_path=args.dataset, engine=args.engine, chunksize=args.chunksize,
+                                             test_size=args.test_size, random_state=args.random_state,
+                                             n_estimators=args.n_estimators)
+    else:
+        if args.engine not in ENGINES:
+            raise SystemExit(f"Engine '{args.engine}' is only available with --out-of-core.")
+        results = pipeline_from_args(args).run(["train"])
+        model, y_test, y_pred, y_pred_proba = results["train"]
+    save_model(model, args.model)
+
+
+def run_evaluate(args):
+    if args.folds < 2:
+        pipeline_from_args(args).run(["metrics"])
+        return
+
+    import numpy as np
+    from cross_validation import cross_validate
+    from new_analysis import plot_evaluation
+
+    if args.engine not in ENGINES:
+        raise SystemExit(f"Engine '{args.engine}' is only available with train --out-of-core.")
+    directory = pipeline_from_args(args).run(["matrix"])["matrix"]
+    params = ({"n_estimators": args.n_estimators} if args.engine == ENGINE_FOREST else
+              {"max_iter": args.max_iter, "learning_rate": args.learning_rate, "early_stopping": args.early_stopping})
+    y_true, y_pred, y_pred_proba, timings = cross_validate(directory, engine=args.engine, n_splits=args.folds,
+                                                           random_state=args.random_state, **params)
+    plot_evaluation(y_true, y_pred, y_pred_proba, np.unique(y_true))
+    timings.to_csv(os.path.join(PATH_RESULTS, "cross_validation_timings.csv"))
+
+
+def run_score(args):
+    import pandas as pd
+    from model import load_model, score_records
+    from new_analysis import prepare_records
+
+    model = load_model(args.model)
+    records = pd.read_csv(args.input)
+    try:
+        X = prepare_records(records, model)
+    except ValueError as error:
+        raise SystemExit(str(error))
+
+    scores = score_records(model, X)
+    if args.explain:
+        from explanation import ExplanationService
+
+        # Top contributing features of the predicted class of each record.
+        try:
+            service = ExplanationService(model)
+        except ValueError as error:
+            raise SystemExit(str(error))
+        explanations = service.explain(X, top_n=args.explain)
+        scores["top_features"] = [
+            "; ".join(f"{feature} ({value:+.3f})" for feature, value in explanation["top_features"][prediction])
+            for explanation, prediction in zip(explanations, scores["prediction"])
+        ]
+        metrics = service.metrics()
+        print(f"\nExplained {len(X)} records in {metrics['latency_mean_ms']:.1f} ms, "
+              f"{metrics['computations']} attributions computed with SHAP, cache hit rate {metrics['hit_rate']:.0%}.")
+    scores.to_csv(args.output, index=False)
+    print(f"\nScores for {len(scores)} records have been written to {args.output}.")
+
+
+def run_explain(args):
+    from new_analysis import visualize_and_interpret
+
+    pipeline = pipeline_from_args(args)
+
+    # The forest is trained on the SMOTE resampled data, boosting on the split as is.
+    features_stage = "balance" if "balance" in pipeline.stages else "split"
+    results = pipeline.run(["encode", features_stage, "train"])
+    X, y = results[features_stage]
+    model = results["train"][0]
+    visualize_and_interpret(results["encode"], model, X)
+
+
+def run_compact(args):
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    from compaction import compact_forest, compaction_report, save_compact_model
+    from new_analysis import handle_class_imbalance
+
+    if args.engine != ENGINE_FOREST:
+        raise SystemExit("Only the Random Forest can be compacted.")
+    X, y = pipeline_from_args(args).run(["split"])["split"]
+
+    # Split the real rows before SMOTE, as cross_validation does, so the trees are ranked and measured on real rows
+    # only: half of the test rows rank the trees, the other half is reported on.
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=args.test_size, random_state=args.random_state,
+                                                        stratify=y)
+    X_val, X_test, y_val, y_test = train_test_split(X_test, y_test, test_size=0.5, random_state=args.random_state,
+                                                    stratify=y_test)
+    X_train, y_train = handle_class_imbalance(X_train, y_train)
+    full_model = RandomForestClassifier(n_estimators=args.n_estimators, random_state=args.random_state)
+    full_model.fit(X_train, y_train)
+
+    compact_model = compact_forest(full_model, X_train, y_train, X_val, y_val, max_depth=args.max_depth,
+                                   min_samples_leaf=args.min_samples_leaf, top_n_trees=args.top_trees,
+                                   distill=args.distill, random_state=args.random_state)
+    print("\nCompact model compared with the full model:")
+    print(compaction_report(full_model, compact_model, X_test, y_test, float32=args.float32).round(3).to_string())
+    save_compact_model(compact_model, args.output, float32=args.float32)
+
+
+def run_refresh(args):
+    from incremental import refresh
+
+    refresh(file_path=args.dataset, model_path=args.model, strategy=args.strategy,
+            trees_per_refresh=args.trees_per_refresh, max_estimators=args.max_estimators,
+            window_years=args.window_years, n_estimators=args.n_estimators, random_state=args.random_state,
+            chunksize=args.chunksize)
+
+
+def run_profile(args):
+    from profiling import DatasetProfile
+
+    profile = DatasetProfile.from_csv(args.dataset, chunksize=args.chunksize, clean=not args.raw)
+    if args.output.endswith(".parquet"):
+        profile.to_parquet(args.output)
+    else:
+        profile.to_json(args.output)
+    print(f"\nProfile of {profile.n_rows} rows has been written to {args.output}.")
+
+
+COMMANDS = {
+    "prep": (run_prep, "Clean and encode the dataset and build the feature matrix, cube and hotspot index."),
+    "visualize": (run_visualize, "Produce the summary statistics and visualization files."),
+    "train": (run_train, "Train the selected engine's classifier and save it."),
+    "evaluate": (run_evaluate, "Train (if needed) and write the metrics visualizations."),
+    "score": (run_score, "Predict the classification of raw collision records with a saved model."),
+    "explain": (run_explain, "Produce the feature importance, SHAP and partial dependence plots."),
+    "compact": (run_compact, "Produce a smaller forest and compare its size, latency and accuracy with the full one."),
+    "refresh": (run_refresh, "Process only the records added since the last refresh and update the model."),
+    "profile": (run_profile, "Compute summary statistics in one streamed pass and write them as JSON or Parquet."),
+}
+
+
+def build_parser():
+    pipeline_parser = argparse.ArgumentParser(add_help=False)
+    pipeline_parser.add_argument("--dataset", default=PATH_ORIGINAL_DATASET, help="Path of the original dataset.")
+    pipeline_parser.add_argument("--no-stack-plots", dest="stack_plots", action="store_false",
+                                 help="Skip the stacked bar plots.")
+    pipeline_parser.add_argument("--test-size", type=float, default=0.3, help="Proportion of the test split.")
+    pipeline_parser.add_argument("--random-state", type=int, default=42, help="Random seed.")
+    pipeline_parser.add_argument("--n-estimators", type=int, default=100, help="Number of trees in the forest.")
+    pipeline_parser.add_argument("--engine", choices=sorted(set(ENGINES + OUT_OF_CORE_ENGINES)), default=ENGINE_FOREST,
+                                 help="Training engine.")
+    pipeline_parser.add_argument("--max-iter", type=int, default=200, help="Maximum number of boosting iterations.")
+    pipeline_parser.add_argument("--learning-rate", type=float, default=0.1, help="Boosting learning rate.")
+    pipeline_parser.add_argument("--no-early-stopping", dest="early_stopping", action="store_false",
+                                 help="Run every boosting iteration.")
+
+    parser = argparse.ArgumentParser(description="Traffic Collision Classifier.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    for name, (func, help_text) in COMMANDS.items():
+        parents = [] if name in ("score", "profile") else [pipeline_parser]
+        subparser = subparsers.add_parser(name, parents=parents, help=help_text, description=help_text)
+        if name in ("train", "score", "refresh"):
+            subparser.add_argument("--model", default=PATH_REFRESH_MODEL if name == "refresh" else PATH_MODEL,
+                                   help="Path of the saved model.")
+        if name == "profile":
+            subparser.add_argument("--dataset", default=PATH_ORIGINAL_DATASET, help="Path of the CSV file to profile.")
+            subparser.add_argument("--output", default=PATH_PROFILE,
+                                   help="Profile file, written as Parquet if it ends with .parquet, else JSON.")
+            subparser.add_argument("--raw", action="store_true", help="Profile the file as is, without cleaning.")
+        if name in ("train", "refresh", "profile"):
+            subparser.add_argument("--chunksize", type=int, default=STREAM_CHUNKSIZE,
+                                   help="Number of rows read at a time when streaming the dataset.")
+        if name == "train":
+            subparser.add_argument("--out-of-core", action="store_true",
+                                   help="Stream the dataset in chunks instead of loading it in memory.")
+        if name == "refresh":
+            subparser.add_argument("--strategy", choices=REFRESH_STRATEGIES, default=REFRESH_WARM_START,
+                                   help="Add trees fitted on the new rows, or retrain on a sliding window.")
+            subparser.add_argument("--trees-per-refresh", type=int, default=20,
+                                   help="Number of trees added by a warm start refresh.")
+            subparser.add_argument("--max-estimators", type=int, default=None,
+                                   help="Maximum number of trees kept, oldest dropped first.")
+            subparser.add_argument("--window-years", type=int, default=3,
+                                   help="Number of most recent years retrained on by a window refresh.")
+        if name == "evaluate":
+            subparser.add_argument("--folds", type=int, default=1, metavar="K",
+                                   help="Evaluate with K-fold cross-validation on out-of-fold predictions.")
+        if name == "compact":
+            subparser.add_argument("--max-depth", type=int, default=None, help="Maximum depth of the trees.")
+            subparser.add_argument("--min-samples-leaf", type=int, default=None,
+                                   help="Minimum number of samples in a leaf.")
+            subparser.add_argument("--top-trees", type=int, default=None,
+                                   help="Number of trees kept, ranked by validation macro F1.")
+            subparser.add_argument("--distill", action="store_true",
+                                   help="Fit a new forest on the full forest's predicted probabilities.")
+            subparser.add_argument("--no-float32", dest="float32", action="store_false",
+                                   help="Store thresholds and leaf values as float64.")
+            subparser.add_argument("--output", default=PATH_COMPACT_MODEL, help="Path of the compact model.")
+        if name == "score":
+            subparser.add_argument("--input", required=True, help="CSV of raw collision records to score.")
+            subparser.add_argument("--output", default=os.path.join(PATH_RESULTS, "scores.csv"),
+                                   help="CSV file the scores are written to.")
+            subparser.add_argument("--explain", type=int, default=0, metavar="N",
+                                   help="Add the N top contributing SHAP features of each prediction.")
+        subparser.set_defaults(func=func)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""
+This file contains the compact model mode.
+
+A trained Random Forest can be made smaller in several ways, which can be combined:
+    - refit with a depth cap and/or a minimum leaf size,
+    - keep only the top-N trees ranked by their macro F1 on a validation set,
+    - distil it into a shallower forest trained on the full forest's predicted probabilities,
+    - store the node arrays of its trees as float32/int32 instead of float64/int64.
+
+The float32 storage only changes how the trees are pickled: they are converted
+back when loaded, so a compact model is loaded with load_model and predicts with
+the usual scikit-learn code. Thresholds are rounded down to float32, which keeps
+every split identical since the trees compare float32 features anyway.
+"""
+
+import copy
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from helpers import write_atomic
+
+FATAL_CODE = DATA_ORDINAL_MAPPINGS[TARGET_FEATURE]["Fatal injury"]
+
+
+def _compact_tree_state(state):
+    """
+    Converts the node arrays of a tree state to 32 bits.
+    """
+    nodes = state["nodes"]
+    compact_dtype = [(name, np.float32 if nodes.dtype[name].kind == "f" else
+                      np.int32 if nodes.dtype[name].kind == "i" else nodes.dtype[name]) for name in nodes.dtype.names]
+    compact_nodes = nodes.astype(compact_dtype)
+
+    # Round thresholds down, so a float32 feature equal to the upper value of a split still goes right.
+    threshold = compact_nodes["threshold"]
+    rounded_up = threshold.astype(np.float64) > nodes["threshold"]
+    threshold[rounded_up] = np.nextafter(threshold[rounded_up], np.float32(-np.inf))
+
+    return dict(state, nodes=compact_nodes, values=state["values"].astype(np.float32))
+
+
+def _restore_tree(args, state):
+    """
+    Rebuilds a tree pickled by save_compact_model, converting its node arrays back to the dtypes scikit-learn uses.
+    """
+    from sklearn.tree._tree import NODE_DTYPE, Tree
+
+    tree = Tree(*args)
+    tree.__setstate__(dict(state, nodes=state["nodes"].astype(NODE_DTYPE), values=state["values"].astype(np.float64)))
+    return tree
+
+
+class _CompactPickler(pickle.Pickler):
+    """
+    Pickler storing the trees of a model with 32-bit node arrays.
+    """
+
+    def reducer_override(self, obj):
+        from sklearn.tree._tree import Tree
+
+        if isinstance(obj, Tree):
+            _, args, state = obj.__reduce__()
+            return _restore_tree, (args, _compact_tree_state(state))
+        return NotImplemented
+
+
+def save_compact_model(model, path, float32=True):
+    """
+    Saves a model, with 32-bit tree node arrays if float32 is True, replacing the previous file
+    only once it is fully written. Load it with load_model.
+
+    Parameters:
+        model: Trained tree model.
+        path (str): Path of the file to write.
+        float32 (bool): Whether to store thresholds and leaf values as float32.
+    """
+    def write(temp_path):
+        with open(temp_path, "wb") as f:
+            if float32:
+                _CompactPickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(model)
+            else:
+                pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    write_atomic(path, write)
+
+    print(f"\nCompact model has been written to {path}.")
+
+
+def tree_scores(model, X_val, y_val):
+    """
+    Computes the macro F1 of each tree of a forest on a validation set.
+    """
+    from sklearn.metrics import f1_score
+
+    # The trees of a forest predict class indices and are fitted without feature names.
+    X_val = np.asarray(X_val, dtype=np.float32)
+    return np.array([f1_score(y_val, model.classes_[tree.predict(X_val).astype(int)], average="macro")
+                     for tree in model.estimators_])
+
+
+def keep_top_trees(model, n_trees, X_val, y_val):
+    """
+    Keeps the n_trees trees of a forest with the best macro F1 on a validation set.
+
+    Returns:
+        A copy of the forest with the selected trees. The trees themselves are shared, not copied.
+    """
+    order = np.argsort(-tree_scores(model, X_val, y_val), kind="stable")[:n_trees]
+
+    compact = copy.copy(model)
+    compact.estimators_ = [model.estimators_[i] for i in sorted(order)]
+    compact.n_estimators = len(compact.estimators_)
+    return compact
+
+
+def compact_forest(model, X_train, y_train, X_val=None, y_val=None, max_depth=None, min_samples_leaf=None,
+                   top_n_trees=None, distill=False, random_state=42):
+    """
+    Produces a smaller version of a trained Random Forest.
+
+    Parameters:
+        model: Trained Random Forest Classifier.
+        X_train (pd.DataFrame): Features the forest was trained on.
+        y_train (pd.Series): Target the forest was trained on.
+        X_val (pd.DataFrame): Validation features used to rank the trees. Required with top_n_trees.
+        y_val (pd.Series): Validation target used to rank the trees.
+        max_depth (int): Maximum depth of the refitted or distilled trees.
+        min_samples_leaf (int): Minimum number of samples in a leaf of the refitted or distilled trees.
+        top_n_trees (int): Number of trees kept. With distill, the number of trees of the distilled forest.
+        distill (bool): Whether to fit a new forest on the full forest's predicted probabilities instead of the labels.
+        random_state (int): Random seed for reproducibility.
+
+    Returns:
+        The compact forest.
+    """
+    from sklearn.base import clone
+
+    params = {key: value for key, value in {"max_depth": max_depth, "min_samples_leaf": min_samples_leaf}.items()
+              if value is not None}
+
+    if distill:
+        # The full forest's hard predictions on its own training rows are almost the labels, so the student learns
+        # its probabilities instead: each row is repeated once per class, weighted by the predicted probability.
+        proba = model.predict_proba(X_train)
+        rows = np.tile(np.arange(len(proba)), proba.shape[1])
+        labels = np.repeat(model.classes_, len(proba))
+        weights = proba.T.ravel()
+        soft = weights > 0
+
+        student = clone(model).set_params(n_estimators=top_n_trees or model.n_estimators, random_state=random_state,
+                                          **params)
+        X_soft = X_train.iloc[rows[soft]] if hasattr(X_train, "iloc") else np.asarray(X_train)[rows[soft]]
+        return student.fit(X_soft, labels[soft], sample_weight=weights[soft])
+
+    compact = model
+    if params:
+        compact = clone(model).set_params(random_state=random_state, **params).fit(X_train, y_train)
+    if top_n_trees and top_n_trees < len(compact.estimators_):
+        if X_val is None:
+            raise ValueError("A validation set is needed to rank the trees.")
+        compact = keep_top_trees(compact, top_n_trees, X_val, y_val)
+    return compact
+
+
+def measure_model(model, X_test, y_test, float32=False, repeats=3):
+    """
+    Measures the stored size, predict latency, macro F1 and Fatal class recall of a model.
+
+    Parameters:
+        model: Trained classifier.
+        X_test (pd.DataFrame): Test features.
+        y_test (pd.Series): Test target codes.
+        float32 (bool): Whether the model is stored with save_compact_model's 32-bit trees.
+        repeats (int): Number of predictions timed, the fastest is kept.
+
+    Returns:
+        dict: The measurements.
+    """
+    from sklearn.metrics import f1_score, recall_score
+
+    if float32:
+        import io
+
+        buffer = io.BytesIO()
+        _CompactPickler(buffer, protocol=pickle.HIGHEST_PROTOCOL).dump(model)
+        size = buffer.tell()
+    else:
+        size = len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        y_pred = model.predict(X_test)
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "trees": len(getattr(model, "estimators_", [])),
+        "nodes": sum(tree.tree_.node_count for tree in getattr(model, "estimators_", [])),
+        "size (MB)": size / 1e6,
+        "predict (ms/1k rows)": min(timings) * 1e6 / max(len(X_test), 1),
+        "macro F1": f1_score(y_test, y_pred, average="macro"),
+        "Fatal recall": recall_score(y_test, y_pred, labels=[FATAL_CODE], average="macro", zero_division=0),
+    }
+
+
+def compaction_report(full_model, compact_model, X_test, y_test, float32=True):
+    """
+    Compares a compact model with the full model.
+
+    Returns:
+        pd.DataFrame: One row of measurements per model, and the ratio of compact to full,
+        left missing where the full model's measurement is 0.
+    """
+    report = pd.DataFrame({
+        "full": measure_model(full_model, X_test, y_test),
+        "compact": measure_model(compact_model, X_test, y_test, float32=float32),
+    }).T
+    report.loc["compact / full"] = report.loc["compact"] / report.loc["full"].replace(0, np.nan)
+    return report
@@ -5,18 +5,44 @@ This file contains all shared constants.
 # File Paths
 PATH_ORIGINAL_DATASET = "Datasets/Traffic_Collision_Dataset.csv"
 PATH_CLEANED_DATASET_OUTPUT = "Updated_Datasets/cleaned_dataset.csv"
+PATH_UNIQUE_VALUES = "Updated_Datasets/unique_cols_dataset.csv"
+PATH_UNIQUE_VALUES_AFTER_TRIM = "Updated_Datasets/unique_cols_dataset_after_trim.csv"
+PATH_STREAM_CLEANED_DATASET = "Updated_Datasets/cleaned_dataset_stream.csv"
+PATH_INCREMENTAL_DATASET = "Updated_Datasets/incremental_dataset.csv"
+PATH_REFRESH_STATE = "Updated_Datasets/refresh_state.json"
+PATH_CUBE = "Updated_Datasets/collision_cube.npz"
+PATH_HOTSPOTS = "Updated_Datasets/hotspot_index.npz"
+PATH_REFRESH_HOTSPOTS = "Updated_Datasets/hotspot_index_refresh.npz"
+PATH_PROFILE = "Results/profile.json"
+PATH_FEATURE_MATRIX = "Updated_Datasets/feature_matrix"
 PATH_VISUALIZATIONS = "Visualizations"
 PATH_RESULTS = "Results"
+PATH_CACHE = "Cache"
+PATH_MAP_CACHE = "Cache/maps"
+PATH_MODEL = "Models/random_forest.pkl"
+PATH_COMPACT_MODEL = "Models/random_forest_compact.pkl"
+PATH_REFRESH_MODEL = "Models/random_forest_refresh.pkl"
 
 # Titles and text.
 TITLE_LENGTH = 42
 DIVIDER_LENGTH = 10
 TITLE_SUMMARY_STATISTICS = "SUMMARY STATISTICS"
 
+# Pipeline constants.
+PIPELINE_MAX_WORKERS = 4  # Maximum number of pipeline stages run concurrently.
+PIPELINE_CACHE_KEEP = 2  # Cached results kept per stage, the current one included, e.g. one per engine.
+STREAM_CHUNKSIZE = 100_000  # Number of rows read at a time in out-of-core mode.
+OUT_OF_CORE_MAX_LEAF_NODES = 1024  # Maximum number of leaves of each tree of an out-of-core forest.
+CROSS_VALIDATION_MEMORY_BUDGET = 4e9  # Bytes the fold copies of the cross-validation workers may use together.
+CROSS_VALIDATION_FOLD_COPIES = 3  # Estimated fold memory of a worker, in multiples of the matrix size.
+
 # Stylistic constants.
 VISUALIZATIONS_FILE_TYPE = ".png"
 
 #  Dataset related constants
+# Target feature being predicted.
+TARGET_FEATURE = "Classification_Of_Accident"
+
 # Final features to be used for analysis.
 FEATURE_LOCATION = "Location"
 DATA_FINAL_FEATURES = [
@@ -52,6 +78,28 @@ DATA_CATEGORICAL_FEATURES = [
     "Traffic_Control",
 ]
 
+# Profiling constants.
+PROFILE_SKETCH_SIZE = 1000  # Maximum number of points of a quantile sketch.
+PROFILE_TOP_K = 1000  # Maximum number of values counted per categorical column, beyond which counts are approximate.
+PROFILE_QUANTILES = (0.25, 0.5, 0.75)
+
+# Maximum number of encoded records whose SHAP attributions are cached by the explanation service.
+EXPLANATION_CACHE_SIZE = 10_000
+
+# Map backgrounds: bounds are rounded outwards to this step (degrees) so nearby bounds share a cached map.
+MAP_BOUNDS_STEP = 0.05
+MAP_RESOLUTION = "i"
+MAP_BACKGROUND_WIDTH = 3000  # Pixels.
+
+# Size of a hotspot grid cell in degrees (about 550 m of latitude).
+HOTSPOT_CELL_SIZE = 0.005
+
+# Categorical features profiled by the statistics engine.
+DATA_PROFILE_CATEGORICAL_FEATURES = [FEATURE_LOCATION] + DATA_CATEGORICAL_FEATURES
+
+# Dimensions of the aggregation cube.
+CUBE_DIMENSIONS = ["year", "month", "hour", "weekday"] + DATA_CATEGORICAL_FEATURES
+
 # List of final numerical features being used.
 DATA_NUMERICAL_FEATURES = [
     "Lat",
@@ -90,3 +138,43 @@ DATA_COLUMNS_TO_DROP = [
     "ID",
     "Num_of_Vehicle"
 ]
+
+# List of categorical columns whose values carry a code prefix (e.g. "01 - ") to trim.
+DATA_COLUMNS_TO_TRIM = [
+    "Classification_Of_Accident",
+    "Initial_Impact_Type",
+    "Road_Surface_Condition",
+    "Environment_Condition",
+    "Light",
+    "Traffic_Control",
+]
+
+# Nominal categorical columns, one-hot encoded for the forest or integer coded for native categorical support.
+DATA_NOMINAL_FEATURES = [
+    "Location_Type",
+    "Initial_Impact_Type",
+    "Road_Surface_Condition",
+    "Environment_Condition",
+    "Traffic_Control",
+]
+
+# Ordinal categorical columns and their label encodings.
+DATA_ORDINAL_MAPPINGS = {
+    "Classification_Of_Accident": {"P.D. only": 0, "Non-fatal injury": 1, "Fatal injury": 2},
+    "Light": {"Dawn": 0, "Daylight": 1, "Dusk": 2, "Dark": 3, "Other": 4},
+}
+
+# Columns gradient boosting splits on as categories: the nominal columns and Light, whose codes have no real order.
+DATA_BOOSTING_CATEGORICAL_FEATURES = DATA_NOMINAL_FEATURES + ["Light"]
+
+# Training engines selectable for the pipeline.
+ENGINE_FOREST = "forest"
+ENGINE_BOOSTING = "boosting"
+ENGINE_SGD = "sgd"
+ENGINES = [ENGINE_FOREST, ENGINE_BOOSTING]
+OUT_OF_CORE_ENGINES = [ENGINE_FOREST, ENGINE_SGD]  # Engines that can train on one chunk at a time.
+
+# Model update strategies of the incremental refresh.
+REFRESH_WARM_START = "warm_start"
+REFRESH_WINDOW = "window"
+REFRESH_STRATEGIES = [REFRESH_WARM_START, REFRESH_WINDOW]
@@ -0,0 +1,153 @@
+"""
+This file contains the parallel k-fold evaluation.
+
+The folds are fitted in worker processes, which open the memory-mapped feature
+matrix themselves, so it is never pickled to them. Each worker still copies the
+training and test rows of its fold into memory, about the size of the matrix,
+and SMOTE or binning copies the training rows again, so the number of folds
+fitted at once is capped to keep those copies within a memory budget.
+Class imbalance is handled inside each fold, on its training rows only:
+SMOTE for the forest, balanced class weights for boosting, as when training.
+The out-of-fold predictions of every row are gathered into a single y_pred and
+y_pred_proba, which the metrics.py plots consume like those of a test split.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from feature_matrix import load_feature_matrix
+
+
+def fold_indices(y, n_splits, random_state):
+    """
+    Stratified, shuffled train and test row indices of each fold.
+    """
+    from sklearn.model_selection import StratifiedKFold
+
+    folds = StratifiedKFold(n_splits=n_splits, shuffle=True, random_state=random_state)
+    return list(folds.split(np.zeros(len(y)), y))
+
+
+def fold_workers(matrix, n_splits, max_workers, memory_budget=CROSS_VALIDATION_MEMORY_BUDGET):
+    """
+    Number of folds fitted at once, so that the fold copies of the workers fit in the memory budget.
+
+    Parameters:
+        matrix (FeatureMatrix): The opened feature matrix.
+        n_splits (int): Number of folds.
+        max_workers (int): Maximum number of worker processes.
+        memory_budget (float): Bytes the fold copies of all the workers may use together.
+
+    Returns:
+        int: The number of worker processes, at least 1.
+    """
+    fold_bytes = CROSS_VALIDATION_FOLD_COPIES * max(matrix.X.nbytes, 1)
+    return max(1, min(max_workers, n_splits, int(memory_budget // fold_bytes)))
+
+
+def _fit_fold(directory, fold, n_splits, engine, random_state, params):
+    """
+    Fits and predicts one fold in a worker process.
+
+    The rows of the fold are copied out of the memory-mapped matrix, since the estimators
+    need them in memory and SMOTE or binning copies them anyway.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from model import build_gradient_boosting
+    from new_analysis import handle_class_imbalance
+
+    if engine == ENGINE_FOREST:
+        import imblearn.over_sampling  # Imported before the timings, which should only measure the fold.
+
+    matrix = load_feature_matrix(directory)
+    matrix.check_engine(engine)
+    classes = np.unique(matrix.y)
+    train_index, test_index = fold_indices(matrix.y, n_splits, random_state)[fold]
+    X_train, y_train = matrix.to_frame(train_index), matrix.y[train_index]
+    X_test = matrix.to_frame(test_index)
+
+    start = time.perf_counter()
+    if engine == ENGINE_BOOSTING:
+        model, X_train, X_test, _ = build_gradient_boosting(X_train, X_test, DATA_BOOSTING_CATEGORICAL_FEATURES,
+                                                            random_state=random_state, **params)
+    else:
+        X_train, y_train = handle_class_imbalance(X_train, y_train)
+        model = RandomForestClassifier(random_state=random_state, **params)
+    balance_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    y_pred_proba = np.zeros((len(test_index), len(classes)))
+    y_pred_proba[:, np.searchsorted(classes, model.classes_)] = model.predict_proba(X_test)
+    predict_time = time.perf_counter() - start
+
+    timings = {
+        "train rows": len(y_train),
+        "test rows": len(test_index),
+        "prepare (s)": balance_time,
+        "fit (s)": fit_time,
+        "predict (s)": predict_time,
+    }
+    return test_index, y_pred, y_pred_proba, timings
+
+
+def cross_validate(directory, engine=ENGINE_FOREST, n_splits=5, random_state=42,
+                   max_workers=PIPELINE_MAX_WORKERS, memory_budget=CROSS_VALIDATION_MEMORY_BUDGET, **params):
+    """
+    Evaluates an engine with stratified k-fold cross-validation, fitting the folds in parallel.
+
+    Parameters:
+        directory (str): Directory of the feature matrix written by the 'matrix' stage.
+        engine (str): ENGINE_FOREST or ENGINE_BOOSTING. Raises ValueError if the matrix was encoded for another engine.
+        n_splits (int): Number of folds.
+        random_state (int): Random seed for reproducibility.
+        max_workers (int): Maximum number of worker processes.
+        memory_budget (float): Bytes the fold copies of the workers may use together, which may lower max_workers.
+        params: Estimator parameters, such as n_estimators for the forest or max_iter for boosting.
+
+    Returns:
+        tuple: A tuple containing:
+            - y_true (np.array): Target of every row.
+            - y_pred (np.array): Out-of-fold predicted labels, aligned with y_true.
+            - y_pred_proba (np.array): Out-of-fold predicted probabilities, one column per class.
+            - timings (pd.DataFrame): Rows, preparation, fit and predict times of each fold.
+    """
+    from sklearn.metrics import accuracy_score, f1_score
+
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Expected one of {ENGINES}.")
+
+    matrix = load_feature_matrix(directory)
+    matrix.check_engine(engine)
+    y_true = np.array(matrix.y)
+    y_pred = np.empty_like(y_true)
+    y_pred_proba = np.zeros((len(y_true), len(np.unique(y_true))))
+    timings = {}
+
+    workers = fold_workers(matrix, n_splits, max_workers, memory_budget)
+    if workers < min(max_workers, n_splits):
+        print(f"\nFitting the folds {workers} at a time to keep their copies of the matrix within "
+              f"{memory_budget / 1e6:,.0f} MB.")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_fit_fold, directory, fold, n_splits, engine, random_state, params)
+                   for fold in range(n_splits)]
+        for fold, future in enumerate(futures):
+            test_index, fold_pred, fold_proba, timings[fold] = future.result()
+            y_pred[test_index], y_pred_proba[test_index] = fold_pred, fold_proba
+
+    timings = pd.DataFrame.from_dict(timings, orient="index").rename_axis("fold")
+    print(f"\n{n_splits}-fold cross-validation of the {engine} engine:")
+    print(timings.round(3).to_string())
+    print(f"Out-of-fold accuracy: {accuracy_score(y_true, y_pred):.2f}, "
+          f"macro F1: {f1_score(y_true, y_pred, average='macro'):.2f}")
+
+    return y_true, y_pred, y_pred_proba, timings
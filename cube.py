@@ -0,0 +1,206 @@
+"""
+This file contains the precomputed spatio-temporal aggregation cube.
+
+Instead of one table over every dimension, whose cells would grow with the
+product of all the vocabularies, the cube keeps a few small dense roll-ups:
+collisions by year, month, hour and weekday, the same times crossed with each
+categorical feature, and every pair of categorical features. A query is answered
+by slicing the smallest roll-up holding its dimensions and summing over the
+other axes, without touching the row-level data.
+"""
+
+import itertools
+import json
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+
+WEEKDAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+TIME_DIMENSIONS = ["year", "month", "hour", "weekday"]
+
+
+class CollisionCube:
+    """
+    Dense count roll-ups over the CUBE_DIMENSIONS.
+
+    Parameters:
+        dimensions (list): Names of the dimensions.
+        vocabularies (dict): The sorted values of each dimension, by name.
+        rollups (dict): Count arrays keyed by the tuple of dimensions of their axes, one axis per dimension
+            indexed by the position of a value in its vocabulary.
+    """
+
+    def __init__(self, dimensions, vocabularies, rollups):
+        self.dimensions = list(dimensions)
+        self.vocabularies = {dim: list(vocabularies[dim]) for dim in self.dimensions}
+        self.rollups = {tuple(dims): counts for dims, counts in rollups.items()}
+        self._positions = {dim: {value: i for i, value in enumerate(values)}
+                           for dim, values in self.vocabularies.items()}
+
+    @classmethod
+    def from_frame(cls, data_frame, dimensions=CUBE_DIMENSIONS):
+        """
+        Builds the cube from the cleaned DataFrame.
+
+        The year, month and hour are stored as integers and the weekday as 0 (Monday) to 6 (Sunday).
+        Each roll-up counts the rows whose values are known for all of its dimensions.
+
+        Parameters:
+            data_frame (pd.DataFrame): The cleaned DataFrame with year, month, day, hour and the categorical features.
+            dimensions (list): Names of the dimensions.
+
+        Returns:
+            CollisionCube: The cube.
+        """
+        time = pd.DataFrame({col: pd.to_numeric(data_frame[col], errors="coerce")
+                             for col in ["year", "month", "day", "hour"]})
+        columns = {
+            "year": time["year"],
+            "month": time["month"],
+            "hour": time["hour"],
+            "weekday": pd.to_datetime(time[["year", "month", "day"]], errors="coerce").dt.weekday,
+        }
+
+        vocabularies, codes = {}, {}
+        for dim in dimensions:
+            values = columns[dim].astype("Int64") if dim in columns else data_frame[dim]
+            codes[dim], uniques = pd.factorize(values, sort=True)
+            vocabularies[dim] = [int(value) for value in uniques] if dim in columns else uniques.tolist()
+
+        time_dimensions = [dim for dim in dimensions if dim in TIME_DIMENSIONS]
+        categorical_dimensions = [dim for dim in dimensions if dim not in TIME_DIMENSIONS]
+        rollups = [time_dimensions] if time_dimensions else []
+        rollups += [time_dimensions + [dim] for dim in categorical_dimensions]
+        rollups += [list(pair) for pair in itertools.combinations(categorical_dimensions, 2)]
+
+        return cls(dimensions, vocabularies, {tuple(dims): cls._count(dims, vocabularies, codes) for dims in rollups})
+
+    @staticmethod
+    def _count(dims, vocabularies, codes):
+        """
+        Counts the rows of each combination of values of some dimensions, skipping rows with a missing value.
+        """
+        shape = tuple(len(vocabularies[dim]) for dim in dims)
+        known = np.logical_and.reduce([codes[dim] >= 0 for dim in dims])
+        cells = np.ravel_multi_index([codes[dim][known] for dim in dims], shape)
+        return np.bincount(cells, minlength=int(np.prod(shape))).reshape(shape).astype(np.uint32)
+
+    @property
+    def n_cells(self):
+        """
+        Total number of cells of the roll-ups.
+        """
+        return sum(counts.size for counts in self.rollups.values())
+
+    def axis(self, dimension):
+        if dimension not in self._positions:
+            raise ValueError(f"Dimension '{dimension}' is not in the cube. Available: {self.dimensions}.")
+        return self.dimensions.index(dimension)
+
+    def _rollup(self, dimensions):
+        """
+        Returns the dimensions of the smallest roll-up holding all the given dimensions.
+        """
+        for dim in dimensions:
+            self.axis(dim)
+        candidates = [dims for dims in self.rollups if set(dimensions) <= set(dims)]
+        if not candidates:
+            raise ValueError(f"No roll-up of the cube holds the dimensions {sorted(dimensions)}. Time dimensions can "
+                             f"be combined with one categorical feature, and categorical features only in pairs.")
+        return min(candidates, key=lambda dims: self.rollups[dims].size)
+
+    def _value(self, dimension, value):
+        """
+        Coerces a where value to the type stored in the cube, raising on values a dimension cannot take.
+
+        Time dimensions are integers, so "2017" selects the year 2017 and the weekday may also be given by name.
+        Integers that never occur simply select nothing, while unknown categories are most likely typos.
+        """
+        if dimension in TIME_DIMENSIONS:
+            if dimension == "weekday" and value in WEEKDAY_NAMES:
+                return WEEKDAY_NAMES.index(value)
+            try:
+                return int(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"Value {value!r} of dimension '{dimension}' is not an integer.") from None
+
+        if value not in self._positions[dimension]:
+            raise ValueError(f"Unknown value {value!r} of dimension '{dimension}'. "
+                             f"Available: {self.vocabularies[dimension]}.")
+        return value
+
+    def query(self, by=(), where=None):
+        """
+        Counts collisions grouped by some dimensions, optionally sliced on others.
+
+        The smallest roll-up holding the by and where dimensions is sliced on the
+        where values and summed over its other axes, so the cost follows the size of
+        that roll-up rather than the number of rows.
+
+        Parameters:
+            by (list): Dimensions to group by. The others are rolled up.
+            where (dict): Values to keep for some dimensions, e.g. {"year": [2017, 2018], "Light": "Dark"}.
+                Raises ValueError for a value the dimension cannot take.
+
+        Returns:
+            pd.Series or int: Counts of the combinations of the by values that occur, sorted and
+            indexed by those values, or the total count when by is empty.
+        """
+        by, where = list(by), where or {}
+        dims = self._rollup(set(by) | set(where))
+        counts = self.rollups[dims]
+        levels = dict(self.vocabularies)
+
+        for dim, values in where.items():
+            values = values if isinstance(values, (list, tuple, set)) else [values]
+            values = dict.fromkeys(self._value(dim, value) for value in values)
+            positions = [self._positions[dim][value] for value in values if value in self._positions[dim]]
+            counts = np.take(counts, positions, axis=dims.index(dim))
+            levels[dim] = [self.vocabularies[dim][position] for position in positions]
+
+        counts = counts.sum(axis=tuple(i for i, dim in enumerate(dims) if dim not in by), dtype=np.int64)
+        if not by:
+            return int(counts)
+
+        kept = [dim for dim in dims if dim in by]
+        counts = np.transpose(counts, [kept.index(dim) for dim in by])
+        if len(by) == 1:
+            index = pd.Index(levels[by[0]], name=by[0])
+        else:
+            index = pd.MultiIndex.from_product([levels[dim] for dim in by], names=by)
+        counts = pd.Series(counts.ravel(), index=index, name="count")
+        return counts[counts > 0]
+
+    def crosstab(self, row, column, where=None):
+        """
+        Counts collisions for every pair of row and column values, like pd.crosstab on the rows.
+        Values that never occur are left out.
+        """
+        return self.query(by=[row, column], where=where).unstack(column, fill_value=0)
+
+    def value_counts(self, dimension, where=None):
+        """
+        Counts collisions for each value of a dimension in descending order, like value_counts on the rows.
+        """
+        return self.query(by=[dimension], where=where).sort_values(ascending=False)
+
+    def save(self, path=PATH_CUBE):
+        """
+        Writes the cube to a compressed .npz file.
+        """
+        names = {f"rollup_{i}": list(dims) for i, dims in enumerate(self.rollups)}
+        np.savez_compressed(path, **{name: self.rollups[tuple(dims)] for name, dims in names.items()},
+                            metadata=json.dumps({"dimensions": self.dimensions, "vocabularies": self.vocabularies,
+                                                 "rollups": names}))
+
+    @classmethod
+    def load(cls, path=PATH_CUBE):
+        """
+        Reads a cube written by save.
+        """
+        with np.load(path) as data:
+            metadata = json.loads(str(data["metadata"]))
+            rollups = {tuple(dims): data[name] for name, dims in metadata["rollups"].items()}
+            return cls(metadata["dimensions"], metadata["vocabularies"], rollups)
@@ -0,0 +1,85 @@
+"""
+Compares answering the counting queries of the visualizations from the
+aggregation cube with pandas on the cleaned rows: the value counts of every
+categorical feature, the crosstab of every pair of them, the time bar plots
+and a sliced query. Prints the median time of each group of queries and the
+size of the cube next to the size of the rows.
+
+Usage:
+    python cube_benchmark.py [--dataset PATH] [--repeat N]
+"""
+
+import argparse
+import statistics
+import time
+
+import pandas as pd
+
+from constants import *
+from cube import CollisionCube
+from new_analysis import build_pipeline
+
+
+def median_time(func, repeat):
+    """
+    Calls func repeat times and returns the median wall time in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare cube queries with pandas on the rows.")
+    parser.add_argument("--dataset", default=PATH_ORIGINAL_DATASET, help="Path of the original dataset.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs per measurement.")
+    args = parser.parse_args(argv)
+
+    # Reuse the cached cleaned dataset.
+    df = build_pipeline(file_path=args.dataset).run(["clean"])["clean"]
+
+    start = time.perf_counter()
+    cube = CollisionCube.from_frame(df)
+    build_time = time.perf_counter() - start
+
+    features = DATA_CATEGORICAL_FEATURES
+    pairs = [(feature1, feature2) for feature1 in features for feature2 in features if feature1 != feature2]
+    times = ["year", "month", "hour"]
+    year = max(cube.vocabularies["year"])
+
+    queries = {
+        f"value counts ({len(features)})": (
+            lambda: [df[feature].value_counts() for feature in features],
+            lambda: [cube.value_counts(feature) for feature in features],
+        ),
+        f"crosstabs ({len(pairs)})": (
+            lambda: [pd.crosstab(df[feature1], df[feature2]) for feature1, feature2 in pairs],
+            lambda: [cube.crosstab(feature1, feature2) for feature1, feature2 in pairs],
+        ),
+        f"time counts ({len(times)})": (
+            lambda: [df.groupby(feature).size() for feature in times],
+            lambda: [cube.query(by=[feature]) for feature in times],
+        ),
+        "dark hours of a year (1)": (
+            lambda: df[(df["Light"] == "Dark") & (df["year"] == year)].groupby("hour").size(),
+            lambda: cube.query(by=["hour"], where={"Light": "Dark", "year": year}),
+        ),
+    }
+
+    results = {}
+    for name, (rows_query, cube_query) in queries.items():
+        rows_time, cube_time = median_time(rows_query, args.repeat), median_time(cube_query, args.repeat)
+        results[name] = {"rows (ms)": rows_time * 1e3, "cube (ms)": cube_time * 1e3, "speed-up": rows_time / cube_time}
+
+    print(f"\nCube of {len(df)} rows built in {build_time:.2f} s: {len(cube.rollups)} roll-ups of {cube.n_cells} "
+          f"cells, {sum(counts.nbytes for counts in cube.rollups.values()) / 1e6:.2f} MB "
+          f"against {df.memory_usage(deep=True).sum() / 1e6:.2f} MB of rows.")
+    print("\nQuery times:")
+    print(pd.DataFrame(results).T.round(2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Compares the Random Forest and Histogram Gradient Boosting training engines
+side by side: fit and predict time, training matrix size, peak memory (RSS)
+during fit, saved model size and macro F1. Each engine is measured in its own
+process, so the peak RSS of one does not include the other.
+
+Both engines are fitted on the same rows of the cleaned dataset (no SMOTE),
+the forest on the one-hot encoded frame and boosting on integer codes with
+uint8 binned numerical features.
+
+Usage:
+    python engine_benchmark.py [--dataset PATH] [--n-estimators N] [--max-iter N]
+"""
+
+import argparse
+import multiprocessing
+import multiprocessing.forkserver
+import pickle
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import f1_score
+from sklearn.model_selection import train_test_split
+
+from constants import *
+from model import split_features_target, build_gradient_boosting
+from new_analysis import build_pipeline, build_vocabularies, columns_codes, columns_encoding
+
+
+def peak_rss():
+    """
+    Peak resident set size of the current process in bytes (ru_maxrss is in kilobytes on Linux, bytes on macOS).
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def measure(model, X_train, y_train, X_test, y_test):
+    """
+    Fits and scores a model, measuring time and memory. Meant to run in a fresh process, see measure_in_process.
+
+    The peak RSS covers the allocations of the compiled tree code, which tracemalloc does not see.
+
+    Returns:
+        dict: The measurements.
+    """
+    rss_before = peak_rss()
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_time = time.perf_counter() - start
+    rss_after = peak_rss()
+
+    start = time.perf_counter()
+    y_pred = model.predict(X_test)
+    predict_time = time.perf_counter() - start
+
+    return {
+        "fit (s)": fit_time,
+        "predict (s)": predict_time,
+        "train matrix (MB)": X_train.memory_usage(deep=True).sum() / 1e6,
+        "peak RSS before fit (MB)": rss_before / 1e6,
+        "peak RSS after fit (MB)": rss_after / 1e6,
+        "model size (MB)": len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL)) / 1e6,
+        "macro F1": f1_score(y_test, y_pred, average="macro"),
+    }
+
+
+def _measure_and_return(model, X_train, y_train, X_test, y_test):
+    return measure(model, X_train, y_train, X_test, y_test), model
+
+
+def measure_in_process(model, X_train, y_train, X_test, y_test):
+    """
+    Runs measure in a new process forked from the fork server, so its peak RSS only reflects this engine.
+
+    Returns:
+        tuple: The measurements and the fitted model.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("forkserver")) as executor:
+        return executor.submit(_measure_and_return, model, X_train, y_train, X_test, y_test).result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the training engines.")
+    parser.add_argument("--dataset", default=PATH_ORIGINAL_DATASET, help="Path of the original dataset.")
+    parser.add_argument("--test-size", type=float, default=0.3, help="Proportion of the test split.")
+    parser.add_argument("--random-state", type=int, default=42, help="Random seed.")
+    parser.add_argument("--n-estimators", type=int, default=100, help="Number of trees in the forest.")
+    parser.add_argument("--max-iter", type=int, default=200, help="Maximum number of boosting iterations.")
+    args = parser.parse_args(argv)
+
+    # Linux keeps the peak RSS across fork and exec, so the measuring processes are forked from a server
+    # started now, before the data is loaded, rather than from this process.
+    multiprocessing.set_forkserver_preload(["engine_benchmark"])
+    multiprocessing.forkserver.ensure_running()
+
+    # Reuse the cached cleaned dataset.
+    df = build_pipeline(file_path=args.dataset).run(["clean"])["clean"]
+    df = df.drop(columns=[FEATURE_LOCATION])
+
+    # Forest: one-hot encoded frame.
+    X, y = split_features_target(columns_encoding(df.copy()), TARGET_FEATURE)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=args.test_size,
+                                                        random_state=args.random_state)
+    forest = RandomForestClassifier(n_estimators=args.n_estimators, random_state=args.random_state)
+    results = {}
+    results[ENGINE_FOREST], forest = measure_in_process(forest, X_train, y_train, X_test, y_test)
+
+    # Boosting: integer codes and binned numerical features, split on the same rows.
+    X, y = split_features_target(columns_codes(df, build_vocabularies(df)), TARGET_FEATURE)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=args.test_size,
+                                                        random_state=args.random_state)
+    boosting, X_train, X_test, _ = build_gradient_boosting(X_train, X_test, DATA_BOOSTING_CATEGORICAL_FEATURES,
+                                                           random_state=args.random_state, max_iter=args.max_iter,
+                                                           early_stopping=True)
+    results[ENGINE_BOOSTING], boosting = measure_in_process(boosting, X_train, y_train, X_test, y_test)
+
+    comparison = pd.DataFrame(results)
+    print("\nEngine comparison:")
+    print(comparison.round(3))
+    print(f"\nForest columns: {len(forest.feature_names_in_)}, boosting columns: {len(boosting.feature_names_in_)}, "
+          f"boosting iterations: {boosting.n_iter_}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""
+This file contains the online explanation service.
+
+The service keeps a SHAP TreeExplainer loaded for a trained model and returns
+per-class attributions and the top contributing features of small batches of
+encoded records. Many collision reports share the same categorical profile, so
+attributions are kept in an LRU cache keyed by the encoded feature vector, and
+only the distinct vectors missing from the cache are sent to SHAP.
+
+TreeExplainer does not support the native categorical splits of histogram
+gradient boosting and returns wrong attributions for them, so such models are
+rejected.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+
+
+class ExplanationService:
+    """
+    Per-record SHAP attributions with an LRU cache and latency and hit-rate metrics.
+
+    Parameters:
+        model: Trained tree model: Random Forest, or gradient boosting without categorical features.
+        cache_size (int): Maximum number of cached feature vectors.
+        latency_window (int): Number of most recent requests kept for the latency metrics.
+    """
+
+    def __init__(self, model, cache_size=EXPLANATION_CACHE_SIZE, latency_window=1000):
+        import shap
+
+        is_categorical = getattr(model, "is_categorical_", None)
+        if is_categorical is not None and np.any(is_categorical):
+            raise ValueError("SHAP TreeExplainer does not support the native categorical features of gradient "
+                             "boosting, its attributions would be wrong. Explain a Random Forest instead.")
+
+        self.model = model
+        self.feature_names = list(model.feature_names_in_)
+        self.classes = list(model.classes_)
+        self.explainer = shap.TreeExplainer(model)
+        self.expected_value = np.ravel(self.explainer.expected_value)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=latency_window)
+        self.hits = 0
+        self.misses = 0
+        self.computations = 0
+
+    def _shap_values(self, X):
+        """
+        Computes SHAP values as an array of shape (records, features, classes), whatever the shap version.
+        """
+        values = self.explainer.shap_values(X)
+        if isinstance(values, list):
+            values = np.stack(values, axis=-1)
+        if values.ndim == 2:
+            values = values[:, :, np.newaxis]
+        return values
+
+    def attributions(self, X):
+        """
+        Computes the SHAP attributions of encoded records, reusing cached ones.
+
+        Parameters:
+            X (pd.DataFrame): Encoded records aligned to the model's feature columns.
+
+        Returns:
+            np.array: Attributions of shape (records, features, classes).
+        """
+        start = time.perf_counter()
+        vectors = np.ascontiguousarray(X[self.feature_names].to_numpy(dtype=np.float64))
+        keys = [row.tobytes() for row in vectors]
+
+        results, missing = [None] * len(keys), {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    results[i] = self._cache[key]
+                    self.hits += 1
+                elif key in missing:
+                    # A repeat of a vector of the same batch reuses its attributions.
+                    missing[key].append(i)
+                    self.hits += 1
+                else:
+                    missing[key] = [i]
+                    self.misses += 1
+
+        # Explain each distinct missing vector once.
+        if missing:
+            rows = [positions[0] for positions in missing.values()]
+            values = self._shap_values(X.iloc[rows][self.feature_names])
+            with self._lock:
+                self.computations += len(rows)
+                for (key, positions), value in zip(missing.items(), values):
+                    for i in positions:
+                        results[i] = value
+                    self._cache[key] = value
+                    self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        self._latencies.append(time.perf_counter() - start)
+        return np.stack(results) if results else np.empty((0, len(self.feature_names), len(self.classes)))
+
+    def explain(self, X, top_n=5):
+        """
+        Explains a batch of encoded records.
+
+        Parameters:
+            X (pd.DataFrame): Encoded records aligned to the model's feature columns.
+            top_n (int): Number of top contributing features returned per class.
+
+        Returns:
+            list: One dict per record with:
+                - attributions: DataFrame of SHAP values, features by classes.
+                - top_features: for each class, the top_n (feature, SHAP value) pairs by absolute value.
+                - expected_value: the explainer's base value of each class.
+        """
+        values = self.attributions(X)
+        explanations = []
+        for record in values:
+            attributions = pd.DataFrame(record, index=self.feature_names, columns=self.classes[:record.shape[1]])
+            top_features = {}
+            for label in attributions.columns:
+                column = attributions[label]
+                top = column.reindex(column.abs().sort_values(ascending=False).index[:top_n])
+                top_features[label] = list(top.items())
+            explanations.append({
+                "attributions": attributions,
+                "top_features": top_features,
+                "expected_value": dict(zip(attributions.columns, self.expected_value)),
+            })
+        return explanations
+
+    def metrics(self):
+        """
+        Returns the cache hit rate, the number of attributions computed with SHAP and the
+        request latencies (in milliseconds) of the service.
+
+        A record is a hit when its vector is cached or repeats an earlier record of the same
+        batch, and a miss otherwise. Concurrent requests missing the same vector each compute
+        it, so computations can exceed misses.
+        """
+        latencies = np.array(self._latencies) * 1000
+        lookups = self.hits + self.misses
+        return {
+            "requests": len(latencies),
+            "cached_vectors": len(self._cache),
+            "hits": self.hits,
+            "misses": self.misses,
+            "computations": self.computations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_mean_ms": float(latencies.mean()) if len(latencies) else None,
+            "latency_p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+            "latency_p95_ms": float(np.percentile(latencies, 95)) if len(latencies) else None,
+        }
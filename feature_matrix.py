@@ -0,0 +1,178 @@
+"""
+This file contains the memory-mapped shared feature matrix.
+
+The encoded features and target are written once as aligned NumPy arrays
+(X as float32, y as int64) next to a small JSON sidecar holding the column
+names, original dtypes, vocabularies and the engine the features were encoded
+for. Each engine encodes the features its own way, so each has its own matrix
+directory, and readers check the engine of the sidecar before using a matrix.
+Any process can then open them memory-mapped and read-only: the operating
+system shares the pages between processes, so opening the matrix in several
+workers does not copy it. Selecting rows does, so a worker fitting on a subset,
+such as a fold, holds its own copy of those rows. float32 is the dtype
+scikit-learn trees work in, so fitting on the whole of X does not convert it to
+another copy.
+"""
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from helpers import write_atomic
+
+X_FILE = "X.npy"
+Y_FILE = "y.npy"
+METADATA_FILE = "metadata.json"
+
+
+class FeatureMatrix:
+    """
+    An opened feature matrix.
+
+    Parameters:
+        X (np.array): Features, one row per collision, memory-mapped when opened with mmap=True.
+        y (np.array): Target codes aligned with X.
+        metadata (dict): Column names, original dtypes, vocabularies, target name and engine.
+    """
+
+    def __init__(self, X, y, metadata):
+        self.X = X
+        self.y = y
+        self.metadata = metadata
+
+    @property
+    def columns(self):
+        return self.metadata["columns"]
+
+    @property
+    def engine(self):
+        return self.metadata.get("engine")
+
+    def check_engine(self, engine):
+        """
+        Raises ValueError if the matrix was not encoded for the engine.
+        """
+        if self.engine != engine:
+            raise ValueError(f"The feature matrix was encoded for the engine '{self.engine}', not '{engine}'. "
+                             f"Rebuild it with the 'matrix' stage of the {engine} engine.")
+
+    def __len__(self):
+        return len(self.y)
+
+    def to_frame(self, rows=slice(None)):
+        """
+        Copies some rows into a DataFrame with the original column names, for estimators that check them.
+        """
+        return pd.DataFrame(self.X[rows], columns=self.columns)
+
+
+def matrix_directory(engine=ENGINE_FOREST):
+    """
+    Directory of the feature matrix encoded for an engine.
+    """
+    return os.path.join(PATH_FEATURE_MATRIX, engine)
+
+
+def matrix_files(directory):
+    """
+    Paths of the files of a feature matrix.
+    """
+    return [os.path.join(directory, name) for name in (X_FILE, Y_FILE, METADATA_FILE)]
+
+
+def save_feature_matrix(X, y, directory, vocabularies=None, engine=None):
+    """
+    Writes the encoded features and target as aligned .npy files with a JSON sidecar.
+
+    Parameters:
+        X (pd.DataFrame): Encoded feature matrix. Every column must be numeric (or numeric strings).
+        y (pd.Series): Target codes.
+        directory (str): Directory of the feature matrix.
+        vocabularies (dict): Categories of the integer coded columns, if any.
+        engine (str): Engine the features were encoded for.
+    """
+    metadata = {
+        "columns": list(X.columns),
+        "dtypes": {col: str(dtype) for col, dtype in X.dtypes.items()},
+        "vocabularies": vocabularies or {},
+        "target": y.name,
+        "n_rows": len(y),
+        "engine": engine,
+    }
+    arrays = {
+        X_FILE: np.ascontiguousarray(X.apply(pd.to_numeric).to_numpy(dtype=np.float32)),
+        Y_FILE: y.to_numpy(dtype=np.int64),
+    }
+
+    def write_array(temp_path, array):
+        with open(temp_path, "wb") as f:
+            np.save(f, array)
+
+    def write_metadata(temp_path):
+        with open(temp_path, "w") as f:
+            json.dump(metadata, f, indent=4)
+
+    # Write next to the final files and rename, so readers never see a partial matrix.
+    # The metadata goes last, since it describes the arrays.
+    for name, array in arrays.items():
+        write_atomic(os.path.join(directory, name), lambda temp_path: write_array(temp_path, array))
+    write_atomic(os.path.join(directory, METADATA_FILE), write_metadata)
+
+    print(f"\nFeature matrix of {len(y)} rows and {X.shape[1]} columns has been written to {directory}.")
+
+
+def load_feature_matrix(directory, mmap=True):
+    """
+    Opens a feature matrix written by save_feature_matrix.
+
+    Parameters:
+        directory (str): Directory of the feature matrix.
+        mmap (bool): Whether to memory-map the arrays read-only instead of reading them in memory.
+
+    Returns:
+        FeatureMatrix: The opened feature matrix.
+    """
+    if not os.path.exists(os.path.join(directory, METADATA_FILE)):
+        raise FileNotFoundError(f"No feature matrix found in '{directory}'. Run the 'prep' command first.")
+
+    mmap_mode = "r" if mmap else None
+    with open(os.path.join(directory, METADATA_FILE)) as f:
+        metadata = json.load(f)
+
+    return FeatureMatrix(np.load(os.path.join(directory, X_FILE), mmap_mode=mmap_mode),
+                         np.load(os.path.join(directory, Y_FILE), mmap_mode=mmap_mode), metadata)
+
+
+def _apply_to_rows(func, directory, start, stop):
+    matrix = load_feature_matrix(directory)
+    return func(matrix.X[start:stop], matrix.y[start:stop])
+
+
+def map_row_chunks(func, directory, n_chunks=PIPELINE_MAX_WORKERS,
+                   max_workers=PIPELINE_MAX_WORKERS):
+    """
+    Applies a function to chunks of rows of the feature matrix in worker processes.
+
+    Only the directory and row bounds are sent to the workers, which open the
+    matrix memory-mapped themselves, so nothing is pickled but the results.
+
+    Parameters:
+        func (callable): Module-level function called as func(X_chunk, y_chunk).
+        directory (str): Directory of the feature matrix.
+        n_chunks (int): Number of row chunks.
+        max_workers (int): Number of worker processes.
+
+    Returns:
+        list: The result of each chunk, in row order.
+    """
+    n_rows = len(load_feature_matrix(directory))
+    bounds = np.linspace(0, n_rows, n_chunks + 1).astype(int)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_apply_to_rows, func, directory, start, stop)
+                   for start, stop in zip(bounds[:-1], bounds[1:])]
+        return [future.result() for future in futures]
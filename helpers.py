@@ -2,6 +2,9 @@
 This file contains all shared helper functions.
 """
 
+import os
+import threading
+
 from constants import *
 
 
@@ -24,3 +27,21 @@ def run_section(title: str = "", func=None):
     print_title(title)  # Print title footer.
     print()
 
+
+def write_atomic(path: str, write):
+    """
+    Writes a file through a temporary file next to it and renames it into place,
+    so readers never see a partial file and a crash leaves the previous one intact.
+
+    Parameters:
+        path (str): Path of the file to write.
+        write (callable): Called with the temporary path to write the contents to.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
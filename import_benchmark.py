@@ -0,0 +1,156 @@
+"""
+Benchmarks the import time of each CLI subcommand against the eager imports
+the pipeline script used to pull in.
+
+Every command is run for real through cli.py, in a fresh interpreter with
+python -X importtime, on a sample of the dataset. The runs happen in a scratch
+directory, so the models, results and visualizations of the repository are left
+untouched. The import time of a run is the sum of its top level imports, so it
+includes the imports a command only makes once it gets to them.
+
+Usage:
+    python import_benchmark.py [--dataset PATH] [--rows N] [--repeat N]
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from constants import *
+
+# The libraries new_analysis.py pulled in at module level before the CLI existed, through its star-imports of
+# visualization, interpretability, model and metrics. Listed explicitly, since those modules now import lazily.
+LEGACY_IMPORTS = "; ".join([
+    "import pandas",
+    "import seaborn",
+    "import matplotlib.pyplot",
+    "from mpl_toolkits.basemap import Basemap",
+    "from sklearn.inspection import PartialDependenceDisplay",
+    "import shap",
+    "from sklearn.ensemble import RandomForestClassifier",
+    "from sklearn.model_selection import train_test_split",
+    "from sklearn.metrics import ConfusionMatrixDisplay, classification_report",
+    "from sklearn.preprocessing import label_binarize",
+    "from imblearn.over_sampling import SMOTE",
+])
+
+SCORE_INPUT = "score_input.csv"
+
+# Arguments that keep each command short on the sample. The commands run in this order, so score finds the model
+# saved by train.
+COMMAND_ARGS = {
+    "prep": ["--no-stack-plots"],
+    "visualize": ["--no-stack-plots"],
+    "train": ["--n-estimators", "10"],
+    "evaluate": ["--no-stack-plots", "--n-estimators", "10"],
+    "score": ["--input", SCORE_INPUT],
+    "explain": ["--no-stack-plots", "--n-estimators", "10"],
+    "compact": ["--no-stack-plots", "--n-estimators", "10"],
+    "refresh": ["--n-estimators", "10"],
+    "profile": [],
+}
+
+REPOSITORY = os.path.dirname(os.path.abspath(__file__))
+
+
+def import_seconds(stderr):
+    """
+    Sums the cumulative time of the top level imports in the output of python -X importtime.
+
+    Parameters:
+        stderr (str): Standard error of the interpreter.
+
+    Returns:
+        float: The import time in seconds.
+    """
+    total = 0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line.split("|")
+        # Nested imports are indented under the import that triggered them.
+        if cumulative.strip().isdigit() and not name[1:].startswith(" "):
+            total += int(cumulative)
+    return total / 1e6
+
+
+def timed_run(args, cwd):
+    """
+    Runs the interpreter with python -X importtime and returns its import time in seconds.
+    A run that fails is reported, and counts the imports it made before failing.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime"] + args, cwd=cwd, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, text=True)
+    if result.returncode:
+        error = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+        print(f"Warning: {' '.join(args)} failed: {error[-1] if error else result.returncode}", file=sys.stderr)
+    return import_seconds(result.stderr)
+
+
+def scratch_directory(dataset, rows):
+    """
+    Creates a directory with the output folders of the repository, the camera location datasets
+    and a sample of the collision dataset.
+
+    Parameters:
+        dataset (str): Path of the original dataset.
+        rows (int): Number of rows sampled.
+
+    Returns:
+        str: Path of the directory.
+    """
+    import pandas as pd
+
+    directory = tempfile.mkdtemp(prefix="import_benchmark_")
+    for root, _, _ in os.walk(os.path.join(REPOSITORY, PATH_VISUALIZATIONS)):
+        os.makedirs(os.path.join(directory, os.path.relpath(root, REPOSITORY)), exist_ok=True)
+    for path in [PATH_ORIGINAL_DATASET, PATH_CLEANED_DATASET_OUTPUT, PATH_PROFILE, PATH_MODEL]:
+        os.makedirs(os.path.join(directory, os.path.dirname(path)), exist_ok=True)
+    for name in os.listdir(os.path.join(REPOSITORY, os.path.dirname(PATH_ORIGINAL_DATASET))):
+        if name.endswith(".csv"):
+            shutil.copy(os.path.join(REPOSITORY, os.path.dirname(PATH_ORIGINAL_DATASET), name),
+                        os.path.join(directory, os.path.dirname(PATH_ORIGINAL_DATASET)))
+
+    sample = pd.read_csv(dataset, nrows=rows)
+    sample.to_csv(os.path.join(directory, PATH_ORIGINAL_DATASET), index=False)
+
+    # Records without a usable date and time can't be scored.
+    scorable = (sample["Accident_Date"].astype(str).str.count("/").eq(2)
+                & sample["Accident_Time"].astype(str).str.contains(":"))
+    sample[scorable].head(100).to_csv(os.path.join(directory, SCORE_INPUT), index=False)
+    return directory
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark CLI subcommand import time.")
+    parser.add_argument("--dataset", default=PATH_ORIGINAL_DATASET, help="Path of the original dataset.")
+    parser.add_argument("--rows", type=int, default=2000, help="Number of rows of the dataset the commands run on.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of runs per measurement.")
+    args = parser.parse_args(argv)
+
+    baseline = statistics.median(timed_run(["-c", LEGACY_IMPORTS], REPOSITORY) for _ in range(args.repeat))
+
+    # Each repeat starts from an empty cache, so the commands import what a first run imports.
+    timings = {command: [] for command in COMMAND_ARGS}
+    for _ in range(args.repeat):
+        directory = scratch_directory(os.path.abspath(args.dataset), args.rows)
+        try:
+            for command, command_args in COMMAND_ARGS.items():
+                timings[command].append(timed_run([os.path.join(REPOSITORY, "cli.py"), command] + command_args,
+                                                  directory))
+        finally:
+            shutil.rmtree(directory)
+
+    print(f"{'command':<12}{'seconds':>10}{'vs legacy':>12}")
+    print(f"{'legacy':<12}{baseline:>10.3f}{1:>12.0%}")
+    for command, command_timings in timings.items():
+        elapsed = statistics.median(command_timings)
+        print(f"{command:<12}{elapsed:>10.3f}{elapsed / baseline:>12.0%}")
+
+
+if __name__ == "__main__":
+    main()
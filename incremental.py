@@ -0,0 +1,221 @@
+"""
+This file contains the incremental refresh mode.
+
+A refresh keeps a watermark on Accident_Date, with the ObjectIds of the rows of
+that date already processed, and only cleans and encodes the rows appended to
+the original dataset since the last refresh, using the vocabularies frozen at
+the first refresh. The forest, kept apart from the one of the train command
+since its columns follow the frozen vocabularies, is updated by adding trees
+fitted on the new rows (warm start) or by retraining on a sliding window of
+recent years, so a refresh costs in proportion to the new rows rather than the
+whole history.
+
+The refresh also keeps its own hotspot index of every row it processed. The
+index of the prep pipeline is rebuilt from the whole dataset on each run, so
+adding the new rows to it as well would count them twice.
+
+Only once the model is updated are the encoded rows appended to the incremental
+dataset, the hotspot index updated and the state saved, so a refresh that fails
+leaves every file as it was and can simply be run again.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from helpers import write_atomic
+from model import load_model, save_model
+from new_analysis import build_vocabularies
+from out_of_core import clean_chunk, encode_chunk
+
+DATE_FORMAT = "%Y/%m/%d"
+ID_COLUMN = "ObjectId"
+
+
+def load_refresh_state(path=PATH_REFRESH_STATE):
+    """
+    Loads the refresh state, or returns None if no refresh was done yet.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_refresh_state(state, path=PATH_REFRESH_STATE):
+    """
+    Writes the refresh state, replacing the previous one atomically.
+    """
+    def write(temp_path):
+        with open(temp_path, "w") as f:
+            json.dump(state, f, indent=4)
+
+    write_atomic(path, write)
+
+
+def read_new_rows(file_path, watermark=None, watermark_ids=(), chunksize=STREAM_CHUNKSIZE):
+    """
+    Reads the rows of the original dataset not processed yet: those dated after the watermark,
+    and those dated on the watermark that were appended after it was set.
+
+    Parameters:
+        file_path (str): Path of the original dataset.
+        watermark (str): Latest Accident_Date already processed (YYYY/MM/DD), or None to read every row.
+        watermark_ids (list): ObjectIds of the rows dated on the watermark already processed.
+        chunksize (int): Number of rows read at a time. Older rows are discarded chunk by chunk.
+
+    Returns:
+        tuple: A tuple containing:
+            - new_rows (pd.DataFrame): The raw rows not processed yet.
+            - watermark (str): The latest Accident_Date of the new rows, or the previous watermark.
+            - watermark_ids (list): ObjectIds of the rows dated on the new watermark, processed now or before.
+    """
+    cutoff = pd.to_datetime(watermark, format=DATE_FORMAT) if watermark else None
+    seen = pd.Index(watermark_ids)
+    new_chunks, new_dates, latest = [], [], cutoff
+
+    for chunk in pd.read_csv(file_path, chunksize=chunksize):
+        dates = pd.to_datetime(chunk["Accident_Date"], format=DATE_FORMAT, errors="coerce")
+        if cutoff is None:
+            is_new = dates.notna()
+        else:
+            is_new = (dates > cutoff) | ((dates == cutoff) & ~chunk[ID_COLUMN].isin(seen))
+        if is_new.any():
+            new_chunks.append(chunk[is_new])
+            new_dates.append(dates[is_new])
+            latest = dates[is_new].max() if latest is None else max(latest, dates[is_new].max())
+
+    if not new_chunks:
+        return pd.DataFrame(), watermark, list(watermark_ids)
+
+    new_rows, new_dates = pd.concat(new_chunks), pd.concat(new_dates)
+    ids = new_rows.loc[(new_dates == latest).to_numpy(), ID_COLUMN].tolist()
+    if latest == cutoff:
+        ids = list(watermark_ids) + ids
+    return new_rows, latest.strftime(DATE_FORMAT), ids
+
+
+def read_window(dataset_path, first_year, chunksize=STREAM_CHUNKSIZE):
+    """
+    Reads the rows of the incremental dataset from first_year onwards.
+    """
+    chunks = [chunk[chunk["year"] >= first_year] for chunk in pd.read_csv(dataset_path, chunksize=chunksize)]
+    window = pd.concat(chunks)
+    return window.drop(columns=[TARGET_FEATURE]), window[TARGET_FEATURE]
+
+
+def update_hotspots(new_rows, path=PATH_REFRESH_HOTSPOTS, first=False):
+    """
+    Adds the new rows to the hotspot index of the refreshes, starting it over on the first refresh.
+    """
+    from spatial import HotspotIndex
+
+    if first:
+        hotspots = HotspotIndex.from_frame(new_rows)
+    elif os.path.exists(path):
+        hotspots = HotspotIndex.load(path)
+        hotspots.update(new_rows)
+    else:
+        print(f"Warning: The hotspot index {path} is missing, it is left out until the refresh state is reset.")
+        return
+    hotspots.save(path)
+
+
+def refresh(file_path=PATH_ORIGINAL_DATASET, model_path=PATH_REFRESH_MODEL, state_path=PATH_REFRESH_STATE,
+            dataset_path=PATH_INCREMENTAL_DATASET, hotspots_path=PATH_REFRESH_HOTSPOTS, strategy=REFRESH_WARM_START,
+            trees_per_refresh=20, max_estimators=None, window_years=3, n_estimators=100, random_state=42,
+            chunksize=STREAM_CHUNKSIZE):
+    """
+    Processes the rows appended to the original dataset since the last refresh and updates the model.
+
+    The first refresh processes every row, freezes the vocabularies and trains
+    a new forest. Later refreshes evaluate the current model on the new rows
+    before learning from them, then update it with the chosen strategy.
+
+    Parameters:
+        file_path (str): Path of the original dataset.
+        model_path (str): Path of the refreshed model, separate from the model of the train command.
+        state_path (str): Path of the refresh state (watermark, its processed ObjectIds and frozen vocabularies).
+        dataset_path (str): Path of the incremental encoded dataset.
+        hotspots_path (str): Path of the hotspot index of the refreshed rows.
+        strategy (str): REFRESH_WARM_START to add trees fitted on the new rows,
+            REFRESH_WINDOW to retrain on the last window_years years.
+        trees_per_refresh (int): Number of trees added by a warm start refresh.
+        max_estimators (int): Maximum number of trees kept by warm start refreshes, oldest dropped first.
+        window_years (int): Number of most recent years retrained on by a window refresh.
+        n_estimators (int): Number of trees of a newly trained forest.
+        random_state (int): Random seed for reproducibility.
+        chunksize (int): Number of rows read at a time.
+
+    Returns:
+        tuple: A tuple containing:
+            - model: The updated forest.
+            - n_new_rows (int): Number of new rows added to the incremental dataset.
+    """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.metrics import accuracy_score, f1_score
+
+    if strategy not in REFRESH_STRATEGIES:
+        raise ValueError(f"Unknown refresh strategy '{strategy}'. Expected one of {REFRESH_STRATEGIES}.")
+
+    state = load_refresh_state(state_path)
+    new_rows, watermark, watermark_ids = read_new_rows(file_path, state["watermark"] if state else None,
+                                                       state.get("watermark_ids", []) if state else [], chunksize)
+    if new_rows.empty:
+        print(f"\nNo new rows since the watermark {watermark}, nothing to refresh.")
+        return (load_model(model_path) if state else None), 0
+
+    new_rows = clean_chunk(new_rows)
+    vocabularies = state["vocabularies"] if state else build_vocabularies(new_rows)
+    X_new, y_new = encode_chunk(new_rows, {"vocabularies": vocabularies})
+
+    if not state:
+        model = RandomForestClassifier(n_estimators=n_estimators, class_weight="balanced",
+                                       random_state=random_state)
+        model.fit(X_new, y_new)
+    else:
+        model = load_model(model_path)
+
+        # Prequential evaluation: score the rows before the model learns from them.
+        y_pred = model.predict(X_new)
+        print(f"\nCurrent model on {len(y_new)} new rows: accuracy {accuracy_score(y_new, y_pred):.2f}, "
+              f"macro F1 {f1_score(y_new, y_pred, average='macro'):.2f}")
+
+        # New trees must see every class, otherwise their probabilities have a different shape.
+        if strategy == REFRESH_WARM_START and not np.array_equal(np.unique(y_new), model.classes_):
+            print("Warning: The new rows do not contain every class, retraining on the sliding window instead.")
+            strategy = REFRESH_WINDOW
+
+        if strategy == REFRESH_WARM_START:
+            model.set_params(warm_start=True, n_estimators=model.n_estimators + trees_per_refresh)
+            model.fit(X_new, y_new)
+            if max_estimators and len(model.estimators_) > max_estimators:
+                model.estimators_ = model.estimators_[-max_estimators:]
+                model.n_estimators = max_estimators
+        else:
+            X_window, y_window = read_window(dataset_path, X_new["year"].max() - window_years + 1, chunksize)
+            X_window, y_window = pd.concat([X_window, X_new]), pd.concat([y_window, y_new])
+            model = RandomForestClassifier(n_estimators=n_estimators, class_weight="balanced",
+                                           random_state=random_state)
+            model.fit(X_window, y_window)
+
+    save_model(model, model_path)
+
+    # Append to the incremental dataset, starting it over on the first refresh.
+    X_new.assign(**{TARGET_FEATURE: y_new}).to_csv(dataset_path, index=False, mode="a" if state else "w",
+                                                   header=not state)
+    update_hotspots(new_rows, hotspots_path, first=not state)
+    save_refresh_state({
+        "watermark": watermark,
+        "watermark_ids": watermark_ids,
+        "vocabularies": vocabularies,
+        "n_rows": (state["n_rows"] if state else 0) + len(y_new),
+    }, state_path)
+
+    print(f"Refreshed with {len(y_new)} new rows up to {watermark}, the forest has {len(model.estimators_)} trees.")
+
+    return model, len(y_new)
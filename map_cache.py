@@ -0,0 +1,153 @@
+"""
+This file contains the cached Basemap projection and map background.
+
+Building a Basemap reads and clips the coastline, country and state polygons,
+and drawing them is slower still, while the bounds of the map barely change
+between runs. The projection and a raster of the drawn background are therefore
+cached on disk, keyed by the bounding box, resolution and raster width. A map
+output only projects its points, in one vectorized call, and draws them over the
+background image.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+from constants import *
+from helpers import write_atomic
+
+# Projections already loaded by this process, by cache key.
+_PROJECTIONS = {}
+
+
+def map_bounds(lat, long, step=MAP_BOUNDS_STEP):
+    """
+    Computes the bounding box of coordinates, rounded outwards to a multiple of step degrees.
+
+    Returns:
+        tuple: (lat_min, lat_max, long_min, long_max).
+    """
+    lat, long = np.asarray(lat, dtype=float), np.asarray(long, dtype=float)
+    bounds = (np.floor(np.nanmin(lat) / step) * step, np.ceil(np.nanmax(lat) / step) * step,
+              np.floor(np.nanmin(long) / step) * step, np.ceil(np.nanmax(long) / step) * step)
+    return tuple(round(float(value), 6) for value in bounds)
+
+
+def _cache_key(**params):
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_basemap(bounds, resolution=MAP_RESOLUTION, cache_dir=PATH_MAP_CACHE):
+    """
+    Returns the Mercator Basemap of a bounding box, loaded from the cache or built and cached.
+
+    Parameters:
+        bounds (tuple): (lat_min, lat_max, long_min, long_max), as returned by map_bounds.
+        resolution (str): Resolution of the boundary data ('c', 'l', 'i', 'h' or 'f').
+        cache_dir (str): Directory of the cached maps.
+
+    Returns:
+        Basemap: The projection.
+    """
+    key = _cache_key(bounds=bounds, resolution=resolution)
+    if key in _PROJECTIONS:
+        return _PROJECTIONS[key]
+
+    path = os.path.join(cache_dir, f"basemap-{key}.pkl")
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            basemap = pickle.load(f)
+    else:
+        from mpl_toolkits.basemap import Basemap
+
+        lat_min, lat_max, long_min, long_max = bounds
+        basemap = Basemap(projection="merc", llcrnrlat=lat_min, urcrnrlat=lat_max, llcrnrlon=long_min,
+                          urcrnrlon=long_max, resolution=resolution)
+
+        def write(temp_path):
+            with open(temp_path, "wb") as f:
+                pickle.dump(basemap, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        write_atomic(path, write)
+
+    _PROJECTIONS[key] = basemap
+    return basemap
+
+
+def extent(basemap):
+    """
+    Projected (x_min, x_max, y_min, y_max) corners of a Basemap.
+    """
+    return basemap.llcrnrx, basemap.urcrnrx, basemap.llcrnry, basemap.urcrnry
+
+
+def background_path(basemap, bounds, resolution=MAP_RESOLUTION, width=MAP_BACKGROUND_WIDTH,
+                    cache_dir=PATH_MAP_CACHE):
+    """
+    Returns the path of the background raster (coastlines, countries and states) of a Basemap,
+    rendering it first if it is not cached.
+
+    Parameters:
+        basemap (Basemap): Projection returned by load_basemap for the same bounds and resolution.
+        bounds (tuple): Bounding box of the projection.
+        resolution (str): Resolution of the projection.
+        width (int): Width of the raster in pixels. The height follows the aspect of the projection.
+        cache_dir (str): Directory of the cached maps.
+    """
+    import matplotlib.pyplot as plt
+
+    path = os.path.join(cache_dir, f"background-{_cache_key(bounds=bounds, resolution=resolution, width=width)}.png")
+    if os.path.exists(path):
+        return path
+
+    x_min, x_max, y_min, y_max = extent(basemap)
+    dpi = 100
+    fig = plt.figure(figsize=(width / dpi, width * (y_max - y_min) / (x_max - x_min) / dpi), dpi=dpi)
+    ax = fig.add_axes([0, 0, 1, 1])
+    basemap.drawcoastlines(ax=ax)
+    basemap.drawcountries(ax=ax)
+    basemap.drawstates(ax=ax)
+    ax.set_xlim(x_min, x_max)
+    ax.set_ylim(y_min, y_max)
+    ax.set_axis_off()
+
+    write_atomic(path, lambda temp_path: fig.savefig(temp_path, dpi=dpi, format="png"))
+    plt.close(fig)
+    return path
+
+
+def draw_map(lat, long, resolution=MAP_RESOLUTION, bounds=None, ax=None):
+    """
+    Draws the cached background of a map on an axes and returns the projection and the projected points.
+
+    Parameters:
+        lat (array-like): Latitudes of the points.
+        long (array-like): Longitudes of the points.
+        resolution (str): Resolution of the boundary data.
+        bounds (tuple): Bounding box of the map, computed from the points if None.
+        ax: Matplotlib axes, the current axes if None.
+
+    Returns:
+        tuple: A tuple containing:
+            - basemap (Basemap): The projection, to project other points of the same map.
+            - x (np.array): Projected x coordinates of the points.
+            - y (np.array): Projected y coordinates of the points.
+    """
+    import matplotlib.pyplot as plt
+
+    if bounds is None:
+        bounds = map_bounds(lat, long)
+    basemap = load_basemap(bounds, resolution)
+
+    ax = ax or plt.gca()
+    x_min, x_max, y_min, y_max = extent(basemap)
+    ax.imshow(plt.imread(background_path(basemap, bounds, resolution)), extent=(x_min, x_max, y_min, y_max),
+              origin="upper", interpolation="antialiased")
+    ax.set_xlim(x_min, x_max)
+    ax.set_ylim(y_min, y_max)
+
+    x, y = basemap(np.asarray(long, dtype=float), np.asarray(lat, dtype=float))
+    return basemap, x, y
@@ -1,7 +1,12 @@
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, accuracy_score
+import numpy as np
 import pandas as pd
+import pickle
+import os
+from constants import *
+from helpers import write_atomic
+
+# scikit-learn is imported inside the training functions so that loading and
+# scoring a saved model only imports the estimator modules the pickle needs.
 
 
 def split_features_target(df, target_column):
@@ -72,6 +77,10 @@ def train_random_forest(X, y, test_size=0.3, random_state=42, n_estimators=100):
             - y_test: True labels for the test set.
             - y_pred: Predicted labels for the test set.
     """
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import classification_report, accuracy_score
+
     # Split the dataset into training and testing sets
     X_train, X_test, y_train, y_test = train_test_split(
         X, y, test_size=test_size, random_state=random_state
@@ -96,3 +105,186 @@ def train_random_forest(X, y, test_size=0.3, random_state=42, n_estimators=100):
     print(classification_report(y_test, y_pred))
 
     return model, y_test, y_pred, y_pred_proba
+
+
+def bin_numerical_features(X, bin_edges=None, columns=DATA_NUMERICAL_FEATURES, max_bins=255):
+    """
+    Bins numerical columns to uint8 codes using quantile bin edges.
+
+    Histogram gradient boosting bins its inputs anyway, so binning up front only
+    shrinks the feature matrix (one byte per value instead of eight) without losing information.
+
+    Parameters:
+        X (pd.DataFrame): Feature matrix.
+        bin_edges (dict): Bin edges of each column, as returned by a previous call. Computed from X if None.
+        columns (list): Numerical columns to bin when computing the bin edges. Missing columns are skipped.
+        max_bins (int): Maximum number of bins per column. At most 256 so codes fit in uint8.
+
+    Returns:
+        tuple: A tuple containing:
+            - X (pd.DataFrame): The feature matrix with binned columns.
+            - bin_edges (dict): The bin edges of each binned column.
+    """
+    if max_bins > 256:
+        raise ValueError(f"max_bins must be at most 256 to fit in uint8, got {max_bins}.")
+
+    X = X.copy()
+    if bin_edges is None:
+        quantiles = np.linspace(0, 1, max_bins + 1)[1:-1]
+        bin_edges = {col: np.unique(np.quantile(pd.to_numeric(X[col]).to_numpy(dtype=float), quantiles))
+                     for col in columns if col in X.columns}
+
+    for col, edges in bin_edges.items():
+        values = pd.to_numeric(X[col]).to_numpy(dtype=float)
+        X[col] = np.searchsorted(edges, values, side="right").astype(np.uint8)
+
+    return X, bin_edges
+
+
+def build_gradient_boosting(X_train, X_test, categorical_features, random_state=42, class_weight="balanced",
+                            **params):
+    """
+    Bins the numerical features with bin edges fitted on the training rows and builds an unfitted
+    Histogram Gradient Boosting Classifier that uses the categorical columns natively.
+
+    Parameters:
+        X_train (pd.DataFrame): Training rows with integer coded categorical columns.
+        X_test (pd.DataFrame): Rows binned with the training bin edges.
+        categorical_features (list): Names of the integer coded categorical columns. Missing columns are skipped.
+        random_state (int): Random seed for reproducibility. Default is 42.
+        class_weight (str or dict): Class weights, "balanced" to handle class imbalance. Default is "balanced".
+        params: Other parameters of the classifier, such as max_iter or learning_rate.
+
+    Returns:
+        tuple: A tuple containing:
+            - model: The unfitted Histogram Gradient Boosting Classifier.
+            - X_train (pd.DataFrame): The binned training rows.
+            - X_test (pd.DataFrame): The binned test rows.
+            - bin_edges (dict): The bin edges of each binned column, to keep with the fitted model.
+    """
+    from sklearn.ensemble import HistGradientBoostingClassifier
+
+    categorical_features = [col for col in categorical_features if col in X_train.columns]
+    numerical_columns = [col for col in X_train.columns if col not in categorical_features]
+    X_train, bin_edges = bin_numerical_features(X_train, columns=numerical_columns)
+    X_test, _ = bin_numerical_features(X_test, bin_edges=bin_edges)
+
+    model = HistGradientBoostingClassifier(categorical_features=categorical_features, class_weight=class_weight,
+                                           random_state=random_state, **params)
+
+    return model, X_train, X_test, bin_edges
+
+
+def train_gradient_boosting(X, y, categorical_features, test_size=0.3, random_state=42, max_iter=200,
+                            learning_rate=0.1, early_stopping=True, class_weight="balanced"):
+    """
+    Trains a Histogram Gradient Boosting Classifier on integer coded features (X) and target (y).
+
+    Categorical columns are used natively instead of one-hot encoded, and the
+    numerical columns are pre-binned to uint8 with bin edges fitted on the training split.
+
+    Parameters:
+        X (pd.DataFrame): Feature matrix with integer coded categorical columns.
+        y (pd.Series or np.array): Target vector.
+        categorical_features (list): Names of the integer coded categorical columns.
+        test_size (float): Proportion of the dataset to include in the test split. Default is 0.3.
+        random_state (int): Random seed for reproducibility. Default is 42.
+        max_iter (int): Maximum number of boosting iterations. Default is 200.
+        learning_rate (float): Learning rate (shrinkage). Default is 0.1.
+        early_stopping (bool): Whether to stop when the validation score stops improving. Default is True.
+        class_weight (str or dict): Class weights, "balanced" to handle class imbalance. Default is "balanced".
+
+    Returns:
+        tuple: A tuple containing:
+            - model: Trained Histogram Gradient Boosting Classifier.
+            - y_test: True labels for the test set.
+            - y_pred: Predicted labels for the test set.
+            - y_pred_proba: Predicted probabilities for the test set.
+    """
+    from sklearn.model_selection import train_test_split
+    from sklearn.metrics import classification_report, accuracy_score
+
+    # Split the dataset into training and testing sets
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=test_size, random_state=random_state
+    )
+
+    # Bin the numerical features using the training set only and initialize the classifier
+    model, X_train, X_test, bin_edges = build_gradient_boosting(
+        X_train, X_test, categorical_features, random_state=random_state, max_iter=max_iter,
+        learning_rate=learning_rate, early_stopping=early_stopping, class_weight=class_weight,
+    )
+
+    # Train the model
+    model.fit(X_train, y_train)
+
+    # Keep the bin edges with the model so new records can be binned the same way
+    model.bin_edges_ = bin_edges
+
+    # Make predictions on the test set
+    y_pred = model.predict(X_test)
+
+    # Get predicted probabilities for all classes
+    y_pred_proba = model.predict_proba(X_test)
+
+    # Print evaluation metrics
+    print("Model Performance:")
+    print(f"Boosting iterations: {model.n_iter_}")
+    print(f"Accuracy: {accuracy_score(y_test, y_pred):.2f}")
+    print("\nClassification Report:")
+    print(classification_report(y_test, y_pred))
+
+    return model, y_test, y_pred, y_pred_proba
+
+
+def save_model(model, path):
+    """
+    Saves a trained model to disk, replacing the previous file only once it is fully written.
+
+    Parameters:
+        model: Trained model.
+        path (str): Path of the file to write.
+    """
+    def write(temp_path):
+        with open(temp_path, "wb") as f:
+            pickle.dump(model, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    write_atomic(path, write)
+
+    print(f"\nModel has been written to {path}.")
+
+
+def load_model(path):
+    """
+    Loads a model saved with save_model.
+
+    Parameters:
+        path (str): Path of the saved model.
+
+    Returns:
+        The trained model.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No trained model found at '{path}'. Run the 'train' command first.")
+
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def score_records(model, X):
+    """
+    Predicts the class and class probabilities of encoded records.
+
+    Parameters:
+        model: Trained classifier.
+        X (pd.DataFrame): Encoded records aligned to the model's feature columns.
+
+    Returns:
+        pd.DataFrame: The predicted class and one probability column per class, indexed like X.
+    """
+    probabilities = model.predict_proba(X)
+
+    scores = pd.DataFrame(probabilities, index=X.index, columns=[f"proba_{c}" for c in model.classes_])
+    scores.insert(0, "prediction", model.classes_[probabilities.argmax(axis=1)])
+
+    return scores
@@ -1,9 +1,9 @@
 import pandas as pd
-from visualization import *
-from interpretability import *
-from model import *
-from imblearn.over_sampling import SMOTE
-from metrics import *
+from constants import *
+from pipeline import Pipeline, Stage
+
+# Plotting, modelling and interpretability libraries are slow to import, so they are
+# imported inside the functions that need them rather than at module level.
 
 
 def data_prep(df):
@@ -13,6 +13,22 @@ def data_prep(df):
     and performing feature engineering.
     """
 
+    from visualization import visualize
+
+    df = clean_data(df)
+
+    # Visualize data insights
+    visualize(df)
+
+    return encode_data(df)
+
+
+def clean_data(df):
+    """
+    Removes unnecessary columns, missing values and 'Unknown' rows, extracts the
+    date and time features and trims the categorical labels.
+    """
+
     # List of columns to drop.
     columns_to_drop = DATA_COLUMNS_TO_DROP
 
@@ -31,25 +47,25 @@ def data_prep(df):
     unique_columns = ["Location_Type", "Classification_Of_Accident", "Initial_Impact_Type", "Road_Surface_Condition",
                       "Environment_Condition", "Light", "Traffic_Control"]
 
-    get_unique_values_to_excel(df, unique_columns, "Updated_Datasets/unique_cols_dataset.csv")
+    get_unique_values_to_excel(df, unique_columns, PATH_UNIQUE_VALUES)
 
     # Specify the columns to process.
-    columns_to_trim = [
-        "Classification_Of_Accident",
-        "Initial_Impact_Type",
-        "Road_Surface_Condition",
-        "Environment_Condition",
-        "Light",
-        "Traffic_Control"
-    ]
+    columns_to_trim = DATA_COLUMNS_TO_TRIM
 
     # Apply the function.
     df = trim_columns(df, columns_to_trim)
 
-    get_unique_values_to_excel(df, columns_to_trim, "Updated_Datasets/unique_cols_dataset_after_trim.csv")
+    get_unique_values_to_excel(df, columns_to_trim, PATH_UNIQUE_VALUES_AFTER_TRIM)
+
+    return df
 
-    # Visualize data insights
-    visualize(df)
+
+def encode_data(df):
+    """
+    Drops the free-text location, encodes the categorical columns and writes the cleaned dataset.
+    """
+
+    df = df.drop(columns=[FEATURE_LOCATION], errors="ignore")
 
     df = columns_encoding(df)
 
@@ -125,20 +141,25 @@ def feature_engineering(df):
     """
     Extracts 'year', 'month', 'day', 'hour', and 'minute'.
     from the 'Accident_Date' and 'Accident_Time' columns.
+    Parts that are missing or not numbers are left as NaN.
     """
 
     # Ensure 'Accident_Date' and 'Accident_Time' columns are strings.
     df["Accident_Date"] = df["Accident_Date"].astype(str)
     df["Accident_Time"] = df["Accident_Time"].astype(str)
 
+    # Split into a fixed number of parts, so a malformed value such as 'Unknown' becomes missing instead of failing.
+    date = df["Accident_Date"].str.split("/", expand=True).reindex(columns=range(3))
+    time = df["Accident_Time"].str.split(":", expand=True).reindex(columns=range(2))
+
     # Extract year, month, and day from Accident_Date.
-    df["year"] = df["Accident_Date"].apply(lambda x: x.split("/")[0])
-    df["month"] = df["Accident_Date"].apply(lambda x: x.split("/")[1])
-    df["day"] = df["Accident_Date"].apply(lambda x: x.split("/")[2])
+    df["year"] = pd.to_numeric(date[0], errors="coerce")
+    df["month"] = pd.to_numeric(date[1], errors="coerce")
+    df["day"] = pd.to_numeric(date[2], errors="coerce")
 
     # Extract hour and minute from Accident_Time.
-    df["hour"] = df["Accident_Time"].apply(lambda x: x.split(":")[0])
-    df["minute"] = df["Accident_Time"].apply(lambda x: x.split(":")[1])
+    df["hour"] = pd.to_numeric(time[0], errors="coerce")
+    df["minute"] = pd.to_numeric(time[1], errors="coerce")
 
     print("\nFeature engineering completed. New features 'year', 'month', 'day', 'hour', and 'minute' have been added.")
     return df
@@ -195,21 +216,111 @@ def trim_columns(df, columns):
     return df
 
 
-def columns_encoding(df):
+def columns_encoding(df, drop_first=True):
     # One-hot encode nominal columns
-    nominal_columns = ["Location_Type", "Initial_Impact_Type", "Road_Surface_Condition", "Environment_Condition",
-                       "Traffic_Control"]
-    df = pd.get_dummies(df, columns=nominal_columns, drop_first=True)
+    nominal_columns = DATA_NOMINAL_FEATURES
+    df = pd.get_dummies(df, columns=nominal_columns, drop_first=drop_first)
+
+    return ordinal_encoding(df)
 
-    # Label encode ordinal columns
-    ordinal_columns = {"Classification_Of_Accident": {"P.D. only": 0, "Non-fatal injury": 1, "Fatal injury": 2},
-                       "Light": {"Dawn": 0, "Daylight": 1, "Dusk": 2, "Dark": 3, "Other": 4}}
-    for col, mapping in ordinal_columns.items():
-        df[col] = df[col].map(mapping)
+
+def ordinal_encoding(df):
+    """
+    Label encodes the ordinal columns present in the DataFrame.
+    """
+    for col, mapping in DATA_ORDINAL_MAPPINGS.items():
+        if col in df.columns:
+            df[col] = df[col].map(mapping)
 
     return df
 
 
+def build_vocabularies(df, columns=DATA_NOMINAL_FEATURES):
+    """
+    Collects the sorted categories of each nominal column.
+
+    Parameters:
+        df (pd.DataFrame): The cleaned DataFrame.
+        columns (list): Nominal columns to collect categories for.
+
+    Returns:
+        dict: The list of categories of each column, by column name.
+    """
+    return {col: sorted(df[col].dropna().unique().tolist()) for col in columns}
+
+
+def columns_codes(df, vocabularies):
+    """
+    Integer codes the nominal columns with fixed vocabularies instead of one-hot encoding them,
+    for models with native categorical support. Values outside a vocabulary are coded -1 (missing).
+
+    Parameters:
+        df (pd.DataFrame): The DataFrame to encode.
+        vocabularies (dict): The categories of each nominal column, as returned by build_vocabularies.
+
+    Returns:
+        pd.DataFrame: The DataFrame with integer coded nominal and ordinal columns.
+    """
+    df = df.copy()
+    for col, categories in vocabularies.items():
+        df[col] = pd.Categorical(df[col], categories=categories).codes
+
+    return ordinal_encoding(df)
+
+
+def prepare_records(df, model):
+    """
+    Cleans and encodes raw collision records for scoring.
+
+    Unlike data_prep, rows are never dropped and nothing is written to disk.
+    Every category is encoded and the result is aligned to the columns the
+    model was trained on, so a small batch encodes the same way as the full dataset.
+    Records without a usable date and time can't be scored and raise a ValueError naming them.
+
+    Parameters:
+        df (pd.DataFrame): Raw records with the columns of the original dataset.
+        model: The trained model the records are scored with.
+
+    Returns:
+        pd.DataFrame: The encoded records with exactly the model's feature columns.
+    """
+    df = df.drop(columns=DATA_COLUMNS_TO_DROP + [FEATURE_LOCATION, TARGET_FEATURE], errors="ignore")
+    df = feature_engineering(df)
+    unscorable = df.index[df[["year", "month", "day", "hour", "minute"]].isna().any(axis=1)]
+    if len(unscorable):
+        raise ValueError(f"{len(unscorable)} records have a missing or malformed Accident_Date or Accident_Time "
+                         f"and can't be scored, at rows {', '.join(map(str, unscorable))}.")
+    df = df.drop(columns=["Accident_Date", "Accident_Time"])
+    df = trim_columns(df, [col for col in DATA_COLUMNS_TO_TRIM if col in df.columns])
+
+    # Models with native categorical support are trained on integer codes and binned numerical features.
+    if hasattr(model, "vocabularies_"):
+        from model import bin_numerical_features
+
+        df = columns_codes(df, model.vocabularies_).reindex(columns=model.feature_names_in_)
+        df, _ = bin_numerical_features(df, bin_edges=model.bin_edges_)
+        return df
+
+    df = columns_encoding(df, drop_first=False).reindex(columns=model.feature_names_in_, fill_value=False)
+
+    # Incrementally trained linear models expect standardized numerical features.
+    if hasattr(model, "feature_means_"):
+        columns = model.feature_means_.index
+        df[columns] = (df[columns].apply(pd.to_numeric) - model.feature_means_) / model.feature_stds_
+
+    return df
+
+
+def encode_codes_data(df, vocabularies):
+    """
+    Drops the free-text location and integer codes the categorical columns.
+    """
+
+    df = df.drop(columns=[FEATURE_LOCATION], errors="ignore")
+
+    return columns_codes(df, vocabularies)
+
+
 def handle_class_imbalance(X, y):
     """
     Handles class imbalance using SMOTE (Synthetic Minority Oversampling Technique).
@@ -221,6 +332,8 @@ def handle_class_imbalance(X, y):
     Returns:
         X_resampled, y_resampled: Balanced feature matrix and target vector.
     """
+    from imblearn.over_sampling import SMOTE
+
     smote = SMOTE(random_state=42)
     X_resampled, y_resampled = smote.fit_resample(X, y)
 
@@ -237,8 +350,11 @@ def visualize_and_interpret(df, model, X):
         model: The trained Random Forest model.
         X: Feature matrix used for training.
     """
+    from interpretability import plot_feature_importance, explain_with_shap, plot_pdp
+
     # Plot feature importance
-    plot_feature_importance(model, X.columns)
+    if hasattr(model, "feature_importances_"):
+        plot_feature_importance(model, X.columns)
 
     # SHAP values for model interpretability
     explain_with_shap(model, X)
@@ -264,42 +380,214 @@ def check_classification_type(y):
         return "Multi-Class Classification"
 
 
-# Specify the path to your CSV file.
-file_path = PATH_ORIGINAL_DATASET
+def load_dataset(file_path):
+    """
+    Loads the original dataset from a CSV file.
+    """
+    return pd.read_csv(file_path)
+
+
+def cube_stage(df):
+    """
+    Pipeline stage building the aggregation cube of the cleaned dataset and writing it to disk.
+    """
+    from cube import CollisionCube
+
+    cube = CollisionCube.from_frame(df)
+    cube.save(PATH_CUBE)
+
+    print(f"\nAggregation cube with {len(cube.rollups)} roll-ups of {cube.n_cells} cells "
+          f"has been written to {PATH_CUBE}.")
+
+    return cube
+
+
+def hotspots_stage(df):
+    """
+    Pipeline stage building the spatial hotspot index of the cleaned dataset and writing it to disk.
+    """
+    from spatial import HotspotIndex
 
-# Load the CSV file into a DataFrame.
-df = pd.read_csv(file_path)
+    hotspots = HotspotIndex.from_frame(df)
+    hotspots.save(PATH_HOTSPOTS)
 
-# Apply data cleaning and pre-processing functions.
-df = data_prep(df)
+    print(f"\nHotspot index with {len(hotspots.cells)} grid cells has been written to {PATH_HOTSPOTS}.")
 
-# Verify successful cleaning.
-print(f"\nFinal number of rows in the cleaned dataset: {len(df)}")
+    return hotspots
+
+
+def visualize_stage(df, cube, hotspots, stack_plots=True):
+    """
+    Pipeline stage producing the statistics summary and visualization files.
+    Works on a copy, since the geographic plots drop the location column in place.
+    """
+    from visualization import visualize
+
+    visualize(df.copy(), stack_plots=stack_plots, cube=cube, hotspots=hotspots)
+
+
+def split_stage(df, target_column):
+    """
+    Pipeline stage splitting the encoded dataset into features and target.
+    """
+    from model import split_features_target
+
+    # Verify successful cleaning.
+    print(f"\nFinal number of rows in the cleaned dataset: {len(df)}")
+
+    return split_features_target(df, target_column)
+
+
+def matrix_stage(features_target, vocabularies=None, engine=ENGINE_FOREST):
+    """
+    Pipeline stage persisting the encoded (X, y) split as a memory-mapped feature matrix for worker processes.
+    Each engine has its own directory, since each encodes the features its own way.
+    Returns the directory, which is all a worker needs to open it.
+    """
+    from feature_matrix import matrix_directory, save_feature_matrix
+
+    X, y = features_target
+    directory = matrix_directory(engine)
+    save_feature_matrix(X, y, directory, vocabularies, engine)
+
+    return directory
+
+
+def balance_stage(features_target):
+    """
+    Pipeline stage handling class imbalance of the (X, y) split.
+    """
+    X, y = features_target
+    X_resampled, y_resampled = handle_class_imbalance(X, y)
+
+    classification_type = check_classification_type(y_resampled)
+    print(f"The task is: {classification_type}")
+
+    return X_resampled, y_resampled
 
-# Split into features and target variables.
-X, y = split_features_target(df, "Classification_Of_Accident")
 
-# Handle class imbalance.
-X_resampled, y_resampled = handle_class_imbalance(X, y)
+def train_stage(resampled, **params):
+    """
+    Pipeline stage training the Random Forest Classifier on the resampled data.
+    """
+    from model import train_random_forest
+
+    X_resampled, y_resampled = resampled
+    return train_random_forest(X_resampled, y_resampled, **params)
+
+
+def train_boosting_stage(features_target, vocabularies, **params):
+    """
+    Pipeline stage training the histogram gradient boosting classifier on the integer coded data.
+    Class imbalance is handled with class weights, since SMOTE would interpolate between category codes.
+    """
+    from model import train_gradient_boosting
+
+    X, y = features_target
+    model, y_test, y_pred, y_pred_proba = train_gradient_boosting(X, y, DATA_BOOSTING_CATEGORICAL_FEATURES, **params)
+
+    # Keep the vocabularies with the model so raw records can be encoded the same way when scoring.
+    model.vocabularies_ = vocabularies
+
+    return model, y_test, y_pred, y_pred_proba
+
+
+def plot_evaluation(y_test, y_pred, y_pred_proba, class_names):
+    """
+    Writes the metrics visualizations of predictions, from a test split or out-of-fold.
+    """
+    from metrics import (plot_confusion_matrix, plot_multiclass_roc_curve, plot_multiclass_precision_recall_curve,
+                         plot_classification_report, plot_misclassifications)
+
+    plot_confusion_matrix(y_test, y_pred, class_names)
+    plot_multiclass_roc_curve(y_test, y_pred_proba, class_names)
+    plot_multiclass_precision_recall_curve(y_test, y_pred_proba, class_names)
+    plot_classification_report(y_test, y_pred)
+    plot_misclassifications(y_test, y_pred)
+
+
+def metrics_stage(features_target, trained):
+    """
+    Pipeline stage writing the metrics visualizations of the trained model.
+    """
+    from metrics import plot_feature_importance_bar
+
+    X, y = features_target
+    model, y_test, y_pred, y_pred_proba = trained
+
+    # Class names for visualization
+    class_names = y.unique()
+
+    plot_evaluation(y_test, y_pred, y_pred_proba, class_names)
+    if hasattr(model, "feature_importances_"):
+        plot_feature_importance_bar(model, X.columns)
+
+
+def build_pipeline(file_path=PATH_ORIGINAL_DATASET, stack_plots=True, test_size=0.3, random_state=42,
+                   n_estimators=100, engine=ENGINE_FOREST, max_iter=200, learning_rate=0.1, early_stopping=True):
+    """
+    Declares the end-to-end pipeline as a DAG of stages.
+
+    The visualization branch only depends on the cleaned data, so it runs
+    concurrently with the modelling branch (split -> balance -> train -> metrics).
+
+    Parameters:
+        file_path (str): Path of the original dataset.
+        stack_plots (bool): Whether to also produce the stacked bar plots.
+        test_size (float): Proportion of the dataset to include in the test split.
+        random_state (int): Random seed for reproducibility.
+        n_estimators (int): Number of trees in the forest.
+        engine (str): Training engine, either ENGINE_FOREST or ENGINE_BOOSTING.
+        max_iter (int): Maximum number of boosting iterations.
+        learning_rate (float): Boosting learning rate.
+        early_stopping (bool): Whether boosting stops when the validation score stops improving.
+
+    Returns:
+        Pipeline: The declared pipeline.
+    """
+    from feature_matrix import matrix_directory, matrix_files
+
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Expected one of {ENGINES}.")
+
+    # Stages writing files declare them, so deleting or overwriting a file reruns the stage.
+    # The plotting stages only write files and are always rerun.
+    pipeline = Pipeline([
+        Stage("load", load_dataset, params={"file_path": file_path}, watch=[file_path]),
+        Stage("clean", clean_data, inputs=["load"], outputs=[PATH_UNIQUE_VALUES, PATH_UNIQUE_VALUES_AFTER_TRIM]),
+        Stage("cube", cube_stage, inputs=["clean"], outputs=[PATH_CUBE]),
+        Stage("hotspots", hotspots_stage, inputs=["clean"], outputs=[PATH_HOTSPOTS]),
+        Stage("visualize", visualize_stage, inputs=["clean", "cube", "hotspots"], params={"stack_plots": stack_plots},
+              plots=True, cache=False),
+    ])
+
+    if engine == ENGINE_FOREST:
+        pipeline.add(Stage("encode", encode_data, inputs=["clean"], outputs=[PATH_CLEANED_DATASET_OUTPUT]))
+        pipeline.add(Stage("split", split_stage, inputs=["encode"], params={"target_column": TARGET_FEATURE}))
+        pipeline.add(Stage("matrix", matrix_stage, inputs=["split"], params={"engine": engine},
+                           outputs=matrix_files(matrix_directory(engine))))
+        pipeline.add(Stage("balance", balance_stage, inputs=["split"]))
+        pipeline.add(Stage("train", train_stage, inputs=["balance"],
+                           params={"test_size": test_size, "random_state": random_state,
+                                   "n_estimators": n_estimators}))
+    else:
+        pipeline.add(Stage("vocabularies", build_vocabularies, inputs=["clean"]))
+        pipeline.add(Stage("encode", encode_codes_data, inputs=["clean", "vocabularies"]))
+        pipeline.add(Stage("split", split_stage, inputs=["encode"], params={"target_column": TARGET_FEATURE}))
+        pipeline.add(Stage("matrix", matrix_stage, inputs=["split", "vocabularies"], params={"engine": engine},
+                           outputs=matrix_files(matrix_directory(engine))))
+        pipeline.add(Stage("train", train_boosting_stage, inputs=["split", "vocabularies"],
+                           params={"test_size": test_size, "random_state": random_state, "max_iter": max_iter,
+                                   "learning_rate": learning_rate, "early_stopping": early_stopping}))
 
-# Example usage
-classification_type = check_classification_type(y_resampled)
-print(f"The task is: {classification_type}")
+    pipeline.add(Stage("metrics", metrics_stage, inputs=["split", "train"], plots=True, cache=False))
 
-# Train the Random Forest Classifier.
-model, y_test, y_pred, y_pred_proba = train_random_forest(X_resampled, y_resampled)
+    return pipeline
 
-# Class names for visualization
-class_names = df["Classification_Of_Accident"].unique()
 
-# Example usage
-# Metrics visualization
-plot_confusion_matrix(y_test, y_pred, class_names)
-plot_multiclass_roc_curve(y_test, y_pred_proba, class_names)
-plot_multiclass_precision_recall_curve(y_test, y_pred_proba, class_names)
-plot_feature_importance_bar(model, X.columns)
-plot_classification_report(y_test, y_pred)
-plot_misclassifications(y_test, y_pred)
+if __name__ == "__main__":
+    # Run the pipeline, reusing cached results whose inputs and parameters are unchanged.
+    results = build_pipeline().run()
 
-# Visualize and create interpretability insights.
-# visualize_and_interpret(df, model, X_resampled)
+    # Visualize and create interpretability insights.
+    # visualize_and_interpret(df, model, X_resampled)
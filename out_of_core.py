@@ -0,0 +1,312 @@
+"""
+This file contains the out-of-core training mode.
+
+The original dataset is cleaned chunk by chunk into a cleaned stream file while
+the vocabularies, class counts and numerical moments are collected. Training
+then streams the cleaned file again, encoding each chunk with the frozen
+vocabularies, and a last pass evaluates the model on a streamed holdout. Only
+one chunk is in memory at a time, so memory does not grow with the number of rows.
+"""
+
+import contextlib
+import io
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+from new_analysis import (remove_columns, check_missing_values, check_unknowns, feature_engineering, trim_columns,
+                          ordinal_encoding)
+
+
+def clean_chunk(df, drop_location=True):
+    """
+    Applies the row-wise cleaning steps of clean_data to a chunk, without its per-step reports and the
+    pandas deprecation warnings they raise, which would otherwise be repeated for every chunk.
+
+    Parameters:
+        df (pd.DataFrame): A chunk of the original dataset.
+        drop_location (bool): Whether to drop the free-text location.
+
+    Returns:
+        pd.DataFrame: The cleaned chunk.
+    """
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        warnings.simplefilter("ignore", FutureWarning)
+        df = remove_columns(df, [col for col in DATA_COLUMNS_TO_DROP if col in df.columns])
+        df = check_missing_values(df)
+        df = check_unknowns(df)
+        df = feature_engineering(df)
+        df = remove_columns(df, ["Accident_Date", "Accident_Time"] + ([FEATURE_LOCATION] if drop_location else []))
+        df = trim_columns(df, DATA_COLUMNS_TO_TRIM)
+
+    return df
+
+
+def prepare_stream(file_path=PATH_ORIGINAL_DATASET, output_file=PATH_STREAM_CLEANED_DATASET,
+                   chunksize=STREAM_CHUNKSIZE):
+    """
+    Cleans the original dataset chunk by chunk into output_file and profiles it.
+
+    Parameters:
+        file_path (str): Path of the original dataset.
+        output_file (str): Path of the cleaned stream file to write.
+        chunksize (int): Number of rows read at a time.
+
+    Returns:
+        dict: The profile of the cleaned data:
+            - vocabularies: sorted categories of each nominal column.
+            - class_counts: number of rows of each target class code.
+            - n_rows: number of cleaned rows.
+            - means, stds: moments of each numerical column.
+    """
+    vocabularies = {col: set() for col in DATA_NOMINAL_FEATURES}
+    class_counts = pd.Series(dtype="int64")
+    sums = sums_of_squares = None
+    n_rows = 0
+
+    for index, chunk in enumerate(pd.read_csv(file_path, chunksize=chunksize)):
+        chunk = clean_chunk(chunk)
+        chunk.to_csv(output_file, index=False, mode="w" if index == 0 else "a", header=index == 0)
+
+        for col in DATA_NOMINAL_FEATURES:
+            vocabularies[col].update(chunk[col].unique())
+        target = chunk[TARGET_FEATURE].map(DATA_ORDINAL_MAPPINGS[TARGET_FEATURE])
+        class_counts = class_counts.add(target.value_counts(), fill_value=0)
+
+        numerical = chunk[DATA_NUMERICAL_FEATURES].apply(pd.to_numeric).astype("float64")
+        chunk_sums, chunk_sums_of_squares = numerical.sum(), (numerical ** 2).sum()
+        sums = chunk_sums if sums is None else sums + chunk_sums
+        sums_of_squares = chunk_sums_of_squares if sums_of_squares is None else sums_of_squares + chunk_sums_of_squares
+        n_rows += len(chunk)
+
+    if not n_rows:
+        raise ValueError(f"No rows left in '{file_path}' after cleaning.")
+
+    means = sums / n_rows
+    stds = np.sqrt((sums_of_squares / n_rows - means ** 2).clip(lower=0)).replace(0, 1)
+
+    print(f"\nCleaned {n_rows} rows into {output_file}.")
+
+    return {
+        "vocabularies": {col: sorted(values) for col, values in vocabularies.items()},
+        "class_counts": class_counts.astype("int64"),
+        "n_rows": n_rows,
+        "means": means,
+        "stds": stds,
+    }
+
+
+def encode_chunk(df, profile, standardize=False):
+    """
+    Encodes a cleaned chunk with the frozen vocabularies of the profile.
+
+    Every category gets its own one-hot column whether or not it occurs in the
+    chunk, so all chunks share the same columns.
+
+    Parameters:
+        df (pd.DataFrame): A chunk of the cleaned stream file.
+        profile (dict): The profile returned by prepare_stream.
+        standardize (bool): Whether to standardize the numerical columns with the profile's moments.
+
+    Returns:
+        tuple: A tuple containing:
+            - X (pd.DataFrame): The encoded float32 features.
+            - y (pd.Series): The target codes.
+    """
+    df = df.copy()
+    for col, categories in profile["vocabularies"].items():
+        df[col] = pd.Categorical(df[col], categories=categories)
+    df = ordinal_encoding(pd.get_dummies(df, columns=list(profile["vocabularies"])))
+
+    numerical = df[DATA_NUMERICAL_FEATURES].apply(pd.to_numeric).astype("float64")
+    if standardize:
+        numerical = (numerical - profile["means"]) / profile["stds"]
+    df[DATA_NUMERICAL_FEATURES] = numerical
+
+    y = df.pop(TARGET_FEATURE)
+    return df.astype("float32"), y
+
+
+def iter_stream(profile, file_path=PATH_STREAM_CLEANED_DATASET, chunksize=STREAM_CHUNKSIZE, holdout=False,
+                test_size=0.3, random_state=42, standardize=False):
+    """
+    Yields the encoded training (or holdout) rows of the cleaned stream file, chunk by chunk.
+
+    Rows are assigned to the holdout with a random draw seeded per chunk, so
+    every pass over the file splits the rows the same way.
+
+    Parameters:
+        profile (dict): The profile returned by prepare_stream.
+        file_path (str): Path of the cleaned stream file.
+        chunksize (int): Number of rows read at a time.
+        holdout (bool): Whether to yield the holdout rows instead of the training rows.
+        test_size (float): Proportion of the rows held out.
+        random_state (int): Random seed of the holdout split.
+        standardize (bool): Whether to standardize the numerical columns.
+
+    Yields:
+        tuple: The encoded features and target of a chunk.
+    """
+    for index, chunk in enumerate(pd.read_csv(file_path, chunksize=chunksize)):
+        in_holdout = np.random.default_rng([random_state, index]).random(len(chunk)) < test_size
+        chunk = chunk[in_holdout if holdout else ~in_holdout]
+        if len(chunk):
+            yield encode_chunk(chunk, profile, standardize=standardize)
+
+
+def class_weights(class_counts):
+    """
+    Computes "balanced" class weights from the class counts of the whole dataset.
+    """
+    return {label: class_counts.sum() / (len(class_counts) * count) for label, count in class_counts.items()}
+
+
+def tree_groups(n_chunks, n_estimators):
+    """
+    Assigns the chunks of a stream to consecutive groups and the trees of a forest to the groups.
+
+    There are at most n_estimators groups, each with at least one tree, so the
+    forest has exactly n_estimators trees however many chunks there are.
+
+    Parameters:
+        n_chunks (int): Number of chunks of the stream.
+        n_estimators (int): Total number of trees of the forest.
+
+    Returns:
+        tuple: A tuple containing:
+            - group_of_chunk (np.array): The group of each chunk.
+            - trees (np.array): The number of trees of each group.
+    """
+    n_groups = max(1, min(n_chunks, n_estimators))
+    group_of_chunk = np.arange(max(n_chunks, 1)) * n_groups // max(n_chunks, 1)
+    trees = np.bincount(np.arange(n_estimators) * n_groups // n_estimators, minlength=n_groups)
+    return group_of_chunk, trees
+
+
+def train_out_of_core(file_path=PATH_ORIGINAL_DATASET, engine=ENGINE_SGD, chunksize=STREAM_CHUNKSIZE,
+                      test_size=0.3, random_state=42, n_estimators=100, max_leaf_nodes=OUT_OF_CORE_MAX_LEAF_NODES):
+    """
+    Trains a classifier without loading the whole dataset in memory.
+
+    With ENGINE_SGD a logistic regression is trained incrementally with partial_fit.
+    With ENGINE_FOREST the chunks are split into at most n_estimators groups of
+    consecutive chunks. Each group contributes an even sample of its chunks' rows,
+    about one chunk in total, to a small Random Forest, and the trees of the groups
+    are merged into one forest of n_estimators trees of at most max_leaf_nodes
+    leaves, so neither the sample nor the forest grows with the number of rows.
+    Class imbalance is handled with balanced class weights, since SMOTE needs the
+    whole dataset.
+
+    Parameters:
+        file_path (str): Path of the original dataset.
+        engine (str): ENGINE_SGD or ENGINE_FOREST.
+        chunksize (int): Number of rows read at a time.
+        test_size (float): Proportion of the rows held out for evaluation.
+        random_state (int): Random seed for reproducibility.
+        n_estimators (int): Total number of trees of the merged forest.
+        max_leaf_nodes (int): Maximum number of leaves of each tree of the merged forest.
+
+    Returns:
+        tuple: A tuple containing:
+            - model: The trained classifier.
+            - confusion (pd.DataFrame): Confusion matrix of the streamed holdout (rows are true classes).
+    """
+    if engine not in OUT_OF_CORE_ENGINES:
+        raise ValueError(f"Unknown out-of-core engine '{engine}'. Expected one of {OUT_OF_CORE_ENGINES}.")
+
+    profile = prepare_stream(file_path, chunksize=chunksize)
+    classes = np.array(sorted(profile["class_counts"].index))
+    weights = class_weights(profile["class_counts"])
+    standardize = engine == ENGINE_SGD
+    stream = dict(profile=profile, chunksize=chunksize, test_size=test_size, random_state=random_state,
+                  standardize=standardize)
+
+    if engine == ENGINE_SGD:
+        from sklearn.linear_model import SGDClassifier
+
+        model = SGDClassifier(loss="log_loss", random_state=random_state)
+        for X, y in iter_stream(**stream):
+            model.partial_fit(X, y, classes=classes, sample_weight=y.map(weights).to_numpy())
+
+        # Keep the moments with the model so new records can be standardized the same way when scoring.
+        model.feature_means_, model.feature_stds_ = profile["means"], profile["stds"]
+    else:
+        from sklearn.ensemble import RandomForestClassifier
+
+        # Spread the trees over groups of chunks so the forest size does not grow with the number of rows.
+        group_of_chunk, trees = tree_groups(-(-profile["n_rows"] // chunksize), n_estimators)
+        group_sizes = np.bincount(group_of_chunk)
+
+        def fit_group(group, samples):
+            nonlocal model
+            X = pd.concat([X for X, _ in samples])
+            y = pd.concat([y for _, y in samples])
+            group_model = RandomForestClassifier(n_estimators=trees[group], class_weight=weights,
+                                                 max_leaf_nodes=max_leaf_nodes, random_state=random_state + group)
+            group_model.fit(X, y)
+
+            # Trees from a group missing a class would predict probabilities of a different shape.
+            if not np.array_equal(group_model.classes_, classes):
+                print(f"Warning: Chunk group {group} does not contain every class, its trees are skipped.")
+            elif model is None:
+                model = group_model
+            else:
+                model.estimators_ += group_model.estimators_
+                model.n_estimators = len(model.estimators_)
+
+        model, samples, group = None, [], 0
+        for index, (X, y) in enumerate(iter_stream(**stream)):
+            # Keep an even share of each chunk of the group, about one chunk of rows in total.
+            group = group_of_chunk[min(index, len(group_of_chunk) - 1)]
+            keep = np.random.default_rng([random_state, index, 1]).random(len(y)) < 1 / group_sizes[group]
+            samples.append((X[keep], y[keep]))
+
+            last_of_group = index + 1 >= len(group_of_chunk) or group_of_chunk[index + 1] != group
+            if last_of_group:
+                fit_group(group, samples)
+                samples = []
+        if samples:
+            fit_group(group, samples)
+
+        if model is None:
+            raise ValueError("No chunk group contains every class. Use a larger chunksize.")
+
+    # Evaluate on the streamed holdout, keeping only the confusion counts.
+    from sklearn.metrics import confusion_matrix
+
+    confusion = np.zeros((len(classes), len(classes)), dtype="int64")
+    for X, y in iter_stream(holdout=True, **stream):
+        confusion += confusion_matrix(y, model.predict(X), labels=classes)
+    confusion = pd.DataFrame(confusion, index=classes, columns=classes)
+
+    print("Model Performance:")
+    print(f"Accuracy: {np.trace(confusion.to_numpy()) / max(confusion.to_numpy().sum(), 1):.2f}")
+    print("\nClassification Report:")
+    print(streamed_classification_report(confusion))
+
+    return model, confusion
+
+
+def streamed_classification_report(confusion):
+    """
+    Computes per-class precision, recall and F1 from a confusion matrix.
+
+    Parameters:
+        confusion (pd.DataFrame): Confusion matrix, rows are true classes and columns predicted classes.
+
+    Returns:
+        pd.DataFrame: The report, with a "macro avg" row.
+    """
+    true_positives = np.diag(confusion.to_numpy())
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.nan_to_num(true_positives / confusion.sum(axis=0).to_numpy())
+        recall = np.nan_to_num(true_positives / confusion.sum(axis=1).to_numpy())
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+
+    report = pd.DataFrame({"precision": precision, "recall": recall, "f1-score": f1,
+                           "support": confusion.sum(axis=1).to_numpy()}, index=confusion.index)
+    report.loc["macro avg"] = [precision.mean(), recall.mean(), f1.mean(), report["support"].sum()]
+
+    return report.round(2)
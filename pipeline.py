@@ -0,0 +1,414 @@
+"""
+This file contains the stage DAG used to run the end-to-end pipeline.
+
+Each stage declares its inputs (other stages), parameters and the files it
+writes. A stage's result is memoized on disk under a key derived from its own
+parameters, the code it runs (its function, the functions and constants of the
+repository it uses and the repository modules it imports), any watched files
+and the keys of its inputs, so only stages whose inputs or parameters changed are rerun. A stage
+whose output files were deleted or overwritten since it ran is rerun as well.
+Only the most recently used results of each stage are kept in the cache.
+
+Independent branches run concurrently: a stage is submitted to the worker
+threads as soon as its last input is ready. Plotting stages run one at a time
+on the main thread, since pyplot is neither thread-safe nor usable off the main
+thread with some interactive backends, while the workers carry on with the rest.
+"""
+
+import ast
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from constants import *
+from helpers import write_atomic
+
+# Directory of the repository modules, whose code is part of the stage keys.
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def file_signature(path):
+    """
+    Size and modification time of a file, or None if it does not exist. Cheap enough to check every run.
+    """
+    if not os.path.exists(path):
+        return None
+
+    status = os.stat(path)
+    return [status.st_size, status.st_mtime_ns]
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    Computes the SHA-256 digest of a file's contents.
+
+    Parameters:
+        path (str): Path of the file to hash.
+        chunk_size (int): Number of bytes read at a time.
+
+    Returns:
+        str: Hex digest of the file, or an empty string if the file does not exist.
+    """
+    if not os.path.exists(path):
+        return ""
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_local(obj):
+    path = getattr(inspect.getmodule(obj), "__file__", None)
+    return path is not None and os.path.dirname(os.path.abspath(path)) == PROJECT_DIR
+
+
+def _code_names(code):
+    """
+    Global, attribute and imported names used by a code object and the code objects nested in it.
+    """
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= _code_names(const)
+    return names
+
+
+def _add_module(path, dependencies):
+    """
+    Adds the digest of a repository module and, recursively, of the repository modules it imports.
+    """
+    name = os.path.relpath(path, PROJECT_DIR)  # Relative, so keys do not depend on where the repository is.
+    if name in dependencies:
+        return
+    dependencies[name] = file_digest(path)
+
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            module_path = os.path.join(PROJECT_DIR, f"{name.split('.')[0]}.py")
+            if os.path.exists(module_path):
+                _add_module(module_path, dependencies)
+
+
+def code_dependencies(func):
+    """
+    Collects the code a function depends on within the repository.
+
+    The function's source is followed into the repository functions it calls,
+    recursively. Repository classes and modules it uses, including modules
+    imported inside functions, are included as the digest of their whole file
+    and of the repository modules they import, and the other globals it reads
+    (constants) by value.
+
+    Parameters:
+        func (callable): The function.
+
+    Returns:
+        dict: Source, file digest or value of each dependency, by name.
+    """
+    dependencies, visited = {}, set()
+
+    def visit(func):
+        if func in visited:
+            return
+        visited.add(func)
+        try:
+            dependencies[f"{func.__module__}.{func.__qualname__}"] = inspect.getsource(func)
+        except (OSError, TypeError):
+            dependencies[repr(func)] = getattr(func, "__qualname__", repr(func))
+            return
+
+        for name in sorted(_code_names(func.__code__)):
+            value = func.__globals__.get(name)
+            module_path = os.path.join(PROJECT_DIR, f"{name}.py")
+            if inspect.isfunction(value) and _is_local(value):
+                visit(value)
+            elif (inspect.isclass(value) or inspect.ismodule(value)) and _is_local(value):
+                _add_module(os.path.abspath(inspect.getsourcefile(value)), dependencies)
+            elif os.path.exists(module_path):
+                _add_module(module_path, dependencies)
+            elif name in func.__globals__ and not callable(value) and not inspect.ismodule(value):
+                dependencies[f"{func.__module__}.{name}"] = repr(value)
+
+    if inspect.isfunction(func):
+        visit(func)
+    else:
+        dependencies[repr(func)] = getattr(func, "__qualname__", repr(func))
+    return dependencies
+
+
+class Stage:
+    """
+    A single step of the pipeline.
+
+    Parameters:
+        name (str): Unique name of the stage.
+        func (callable): Called as func(*input_results, **params).
+        inputs (list): Names of the stages whose results are passed to func, in order.
+        params (dict): Keyword arguments passed to func. Must be JSON serializable (or have a stable str()).
+        watch (list): Paths of files whose contents are part of the stage's key.
+        outputs (list): Paths of the files the stage writes. The cached result is only used while they are
+            unchanged since the stage ran.
+        plots (bool): Whether the stage draws with pyplot and must run on the main thread.
+        cache (bool): Whether the stage's result is memoized on disk. Stages run only for the files they write
+            and whose outputs cannot all be declared, such as plots, should not be cached.
+    """
+
+    def __init__(self, name, func, inputs=(), params=None, watch=(), outputs=(), plots=False, cache=True):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.params = dict(params or {})
+        self.watch = list(watch)
+        self.outputs = list(outputs)
+        self.plots = plots
+        self.cache = cache
+
+    def source(self):
+        return code_dependencies(self.func)
+
+    def run(self, *args):
+        return self.func(*args, **self.params)
+
+
+class Pipeline:
+    """
+    A DAG of stages with on-disk memoization and concurrent execution.
+
+    Parameters:
+        stages (list): Stages to add, in any order.
+        cache_dir (str): Directory where stage results are stored.
+        max_workers (int): Maximum number of stages run at the same time.
+        cache_keep (int): Number of cached results kept per stage, the most recently used first.
+    """
+
+    def __init__(self, stages=(), cache_dir=PATH_CACHE, max_workers=PIPELINE_MAX_WORKERS,
+                 cache_keep=PIPELINE_CACHE_KEEP):
+        self.stages = {}
+        self.cache_dir = cache_dir
+        self.max_workers = max_workers
+        self.cache_keep = cache_keep
+        for stage in stages:
+            self.add(stage)
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Stage '{stage.name}' is already defined.")
+        self.stages[stage.name] = stage
+        return stage
+
+    def topological_order(self, targets=None):
+        """
+        Returns the names of the stages needed for the targets, inputs first.
+        """
+        targets = list(self.stages) if targets is None else list(targets)
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name not in self.stages:
+                raise ValueError(f"Stage '{name}' is not defined.")
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage '{name}'.")
+            visiting.add(name)
+            for dependency in self.stages[name].inputs:
+                visit(dependency)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for target in targets:
+            visit(target)
+        return order
+
+    def keys(self, order):
+        """
+        Computes the content key of every stage in order.
+        """
+        keys = {}
+        for name in order:
+            stage = self.stages[name]
+            payload = json.dumps({
+                "name": name,
+                "source": stage.source(),
+                "params": stage.params,
+                "watch": {path: file_digest(path) for path in stage.watch},
+                "inputs": [keys[dependency] for dependency in stage.inputs],
+            }, sort_keys=True, default=str)
+            keys[name] = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        return keys
+
+    def cache_path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name}-{key[:16]}.pkl")
+
+    def outputs_path(self, name, key):
+        return os.path.join(self.cache_dir, f"{name}-{key[:16]}.outputs.json")
+
+    def is_cached(self, name, key):
+        stage = self.stages[name]
+        if not stage.cache or not os.path.exists(self.cache_path(name, key)):
+            return False
+        if not stage.outputs:
+            return True
+
+        # The output files must still be the ones this result was stored with.
+        if not os.path.exists(self.outputs_path(name, key)):
+            return False
+        with open(self.outputs_path(name, key)) as f:
+            signatures = json.load(f)
+        return all(signatures.get(path) == file_signature(path) for path in stage.outputs)
+
+    def load(self, name, key):
+        path = self.cache_path(name, key)
+        os.utime(path)  # Marks the result as recently used, see prune.
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def prune(self, name, key):
+        """
+        Deletes the cached results of a stage but the current one and the most recently used others.
+        """
+        if not os.path.isdir(self.cache_dir):
+            return
+
+        pattern = re.compile(rf"{re.escape(name)}-([0-9a-f]{{16}})\.pkl")
+        stale = [match.group(1) for match in map(pattern.fullmatch, os.listdir(self.cache_dir))
+                 if match and match.group(1) != key[:16]]
+        stale.sort(key=lambda short_key: os.path.getmtime(os.path.join(self.cache_dir, f"{name}-{short_key}.pkl")),
+                   reverse=True)
+        for short_key in stale[max(self.cache_keep - 1, 0):]:
+            for suffix in (".pkl", ".outputs.json"):
+                path = os.path.join(self.cache_dir, f"{name}-{short_key}{suffix}")
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def store(self, name, key, result):
+        def write_outputs(temp_path):
+            with open(temp_path, "w") as f:
+                json.dump({output: file_signature(output) for output in self.stages[name].outputs}, f)
+
+        def write_result(temp_path):
+            with open(temp_path, "wb") as f:
+                pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # Record the output files first, so a result is never stored without them.
+        write_atomic(self.outputs_path(name, key), write_outputs)
+        write_atomic(self.cache_path(name, key), write_result)  # Atomic, so a crash never leaves a partial result.
+
+    def run(self, targets=None):
+        """
+        Runs the stages needed for the targets (the final stages by default).
+
+        Cached stages are loaded instead of rerun, and their inputs are only
+        loaded if another stage that has to run needs them.
+
+        Parameters:
+            targets (list): Names of the stages whose results are wanted.
+
+        Returns:
+            dict: Results of every stage that was run or loaded, by name.
+        """
+        if targets is None:
+            consumed = {dependency for stage in self.stages.values() for dependency in stage.inputs}
+            targets = [name for name in self.stages if name not in consumed]
+
+        order = self.topological_order(targets)
+        keys = self.keys(order)
+        targets = set(targets)
+
+        # Decide once which stages are cached, so the plan cannot change if an output file is touched during the run.
+        cached = {name: self.is_cached(name, keys[name]) for name in order}
+
+        # Walk backwards from the targets to find which results are actually required.
+        required = set(targets)
+        for name in reversed(order):
+            if name in required and not cached[name]:
+                required.update(self.stages[name].inputs)
+        waiting = [name for name in order if name in required]
+        n_required = len(waiting)
+
+        # Results are added and stages dispatched by the worker threads as they finish. The main thread only runs
+        # the plotting stages it receives from the events queue, which also carries failures and wake-ups.
+        results, lock, events, stopped = {}, threading.RLock(), queue.Queue(), threading.Event()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+
+            def finished(name, future):
+                if future.exception() is not None:
+                    stopped.set()
+                    events.put(future.exception())
+                    return
+                with lock:
+                    results[name] = future.result()
+                    dispatch()
+                events.put(None)
+
+            def dispatch():
+                # Called with the lock held. Submits every waiting stage whose inputs are ready.
+                if stopped.is_set():
+                    return
+                submitted = []
+                for name in list(waiting):
+                    stage = self.stages[name]
+                    if cached[name]:
+                        submitted.append((name, executor.submit(self.load, name, keys[name])))
+                    elif not all(dependency in results for dependency in stage.inputs):
+                        continue
+                    elif stage.plots:
+                        events.put(name)
+                    else:
+                        submitted.append((name, executor.submit(self._execute, name, keys[name],
+                                                                [results[d] for d in stage.inputs])))
+                    waiting.remove(name)
+                for name, future in submitted:
+                    future.add_done_callback(lambda future, name=name: finished(name, future))
+
+            try:
+                with lock:
+                    dispatch()
+                while True:
+                    with lock:
+                        if len(results) == n_required:
+                            break
+                    event = events.get()
+                    if isinstance(event, BaseException):
+                        raise event
+                    if event is not None:
+                        with lock:
+                            args = [results[d] for d in self.stages[event].inputs]
+                        result = self._execute(event, keys[event], args)
+                        with lock:
+                            results[event] = result
+                            dispatch()
+            except BaseException:
+                stopped.set()  # Nothing more is submitted while the running stages finish.
+                raise
+
+        for name in order:
+            if self.stages[name].cache:
+                self.prune(name, keys[name])
+
+        return results
+
+    def _execute(self, name, key, args):
+        print(f"\n<<<Running stage '{name}'>>>")
+        result = self.stages[name].run(*args)
+        if self.stages[name].cache:
+            self.store(name, key, result)
+        return result
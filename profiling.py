@@ -0,0 +1,273 @@
+"""
+This file contains the one-pass statistics engine.
+
+Each column is summarized in a single pass into a mergeable summary: count,
+missing, mean and sum of squared deviations (merged with Chan's formula), min,
+max and a bounded quantile sketch for numerical columns, and value counts for
+categorical columns, exact up to PROFILE_TOP_K distinct values and a bounded
+Misra-Gries top-K summary beyond, so free-text columns such as Location do not
+grow with the number of distinct values. Columns of a chunk are summarized in
+parallel and the summaries of successive chunks are merged, so a file of any
+size is profiled one chunk at a time. The profile is written as JSON or Parquet.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+
+
+class QuantileSketch:
+    """
+    Mergeable approximate quantiles, kept as at most `size` weighted points.
+
+    Parameters:
+        values (np.array): Sorted point values.
+        weights (np.array): Number of rows each point stands for.
+        size (int): Maximum number of points kept.
+    """
+
+    def __init__(self, values=None, weights=None, size=PROFILE_SKETCH_SIZE):
+        self.values = np.empty(0) if values is None else values
+        self.weights = np.empty(0) if weights is None else weights
+        self.size = size
+
+    @classmethod
+    def from_values(cls, values, size=PROFILE_SKETCH_SIZE):
+        values = np.sort(values)
+        return cls(values, np.ones(len(values)), size).compress()
+
+    def compress(self):
+        """
+        Replaces the points by `size` evenly weighted points at the same quantiles, if there are more.
+        """
+        if len(self.values) <= self.size:
+            return self
+
+        cumulative = np.cumsum(self.weights)
+        total = cumulative[-1]
+        targets = (np.arange(self.size) + 0.5) * total / self.size
+        positions = np.minimum(np.searchsorted(cumulative, targets), len(self.values) - 1)
+        self.values, self.weights = self.values[positions], np.full(self.size, total / self.size)
+        return self
+
+    def merge(self, other):
+        order = np.argsort(np.concatenate([self.values, other.values]), kind="stable")
+        values = np.concatenate([self.values, other.values])[order]
+        weights = np.concatenate([self.weights, other.weights])[order]
+        return QuantileSketch(values, weights, self.size).compress()
+
+    def quantile(self, q):
+        """
+        Nearest-rank quantile, exact while fewer than `size` rows were added.
+        """
+        if not len(self.values):
+            return float("nan")
+        cumulative = np.cumsum(self.weights)
+        position = min(np.searchsorted(cumulative, q * cumulative[-1]), len(self.values) - 1)
+        return float(self.values[position])
+
+
+class NumericSummary:
+    """
+    Mergeable summary of a numerical column.
+    """
+
+    def __init__(self, count=0, missing=0, mean=0.0, m2=0.0, minimum=np.inf, maximum=-np.inf, sketch=None):
+        self.count = count
+        self.missing = missing
+        self.mean = mean
+        self.m2 = m2
+        self.minimum = minimum
+        self.maximum = maximum
+        self.sketch = sketch or QuantileSketch()
+
+    @classmethod
+    def from_series(cls, series):
+        values = pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+        present = values[~np.isnan(values)]
+        if not len(present):
+            return cls(missing=len(values))
+
+        mean = present.mean()
+        return cls(len(present), len(values) - len(present), mean, ((present - mean) ** 2).sum(),
+                   present.min(), present.max(), QuantileSketch.from_values(present))
+
+    def merge(self, other):
+        count = self.count + other.count
+        if not count:
+            return NumericSummary(missing=self.missing + other.missing)
+
+        delta = other.mean - self.mean
+        return NumericSummary(
+            count,
+            self.missing + other.missing,
+            self.mean + delta * other.count / count,
+            self.m2 + other.m2 + delta ** 2 * self.count * other.count / count,
+            min(self.minimum, other.minimum),
+            max(self.maximum, other.maximum),
+            self.sketch.merge(other.sketch),
+        )
+
+    def to_dict(self, quantiles=PROFILE_QUANTILES):
+        empty = not self.count
+        return {
+            "type": "numerical",
+            "count": int(self.count),
+            "missing": int(self.missing),
+            "mean": None if empty else float(self.mean),
+            "std": None if self.count < 2 else float(np.sqrt(self.m2 / (self.count - 1))),
+            "min": None if empty else float(self.minimum),
+            "max": None if empty else float(self.maximum),
+            "quantiles": {str(q): None if empty else self.sketch.quantile(q) for q in quantiles},
+        }
+
+
+class CategoricalSummary:
+    """
+    Mergeable summary of a categorical column: value counts of at most `size` values.
+
+    While the column has at most `size` distinct values the counts are exact. Beyond,
+    the counts are pruned as in the Misra-Gries summary: every count is lowered by
+    the (size + 1)-th largest one and those left at zero are dropped. A value is
+    then undercounted by at most `error`, which stays below count / (size + 1), so
+    every value more frequent than that is kept.
+
+    Parameters:
+        count (int): Number of non-missing values summarized.
+        missing (int): Number of missing values.
+        frequencies (pd.Series): Counts of the values kept, by value.
+        error (int): Maximum undercount of a value, 0 while the counts are exact.
+        size (int): Maximum number of values kept.
+    """
+
+    def __init__(self, count=0, missing=0, frequencies=None, error=0, size=PROFILE_TOP_K):
+        self.count = count
+        self.missing = missing
+        self.frequencies = pd.Series(dtype="int64") if frequencies is None else frequencies
+        self.error = error
+        self.size = size
+
+    @classmethod
+    def from_series(cls, series, size=PROFILE_TOP_K):
+        frequencies = series.value_counts()
+        return cls(int(frequencies.sum()), int(series.isna().sum()), frequencies, size=size).prune()
+
+    def prune(self):
+        """
+        Keeps the `size` largest counts, lowered by the next largest one, if there are more.
+        """
+        if len(self.frequencies) <= self.size:
+            return self
+
+        frequencies = self.frequencies.sort_values(ascending=False, kind="stable")
+        threshold = int(frequencies.iloc[self.size])
+        frequencies = frequencies.iloc[:self.size] - threshold
+        self.frequencies, self.error = frequencies[frequencies > 0], self.error + threshold
+        return self
+
+    def merge(self, other):
+        frequencies = self.frequencies.add(other.frequencies, fill_value=0).astype("int64")
+        return CategoricalSummary(self.count + other.count, self.missing + other.missing, frequencies,
+                                  self.error + other.error, self.size).prune()
+
+    def to_dict(self):
+        frequencies = self.frequencies.sort_values(ascending=False, kind="stable")
+        exact = not self.error
+        return {
+            "type": "categorical",
+            "count": int(self.count),
+            "missing": int(self.missing),
+            "unique": int(len(frequencies)) if exact else None,
+            "frequency_error": int(self.error),
+            "top": None if frequencies.empty else str(frequencies.index[0]),
+            "freq": None if frequencies.empty else int(frequencies.iloc[0]),
+            "frequencies": {str(value): int(count) for value, count in frequencies.items()},
+        }
+
+
+class DatasetProfile:
+    """
+    Mergeable summaries of the columns of a dataset.
+
+    Parameters:
+        summaries (dict): NumericSummary or CategoricalSummary of each column, by name.
+        n_rows (int): Number of rows summarized.
+    """
+
+    def __init__(self, summaries=None, n_rows=0):
+        self.summaries = summaries or {}
+        self.n_rows = n_rows
+
+    @classmethod
+    def from_frame(cls, data_frame, numerical=DATA_NUMERICAL_FEATURES, categorical=DATA_PROFILE_CATEGORICAL_FEATURES,
+                   max_workers=PIPELINE_MAX_WORKERS):
+        """
+        Summarizes the columns of a DataFrame in one pass each, in parallel across columns.
+        Columns missing from the DataFrame are skipped.
+        """
+        jobs = [(col, NumericSummary) for col in numerical if col in data_frame.columns]
+        jobs += [(col, CategoricalSummary) for col in categorical if col in data_frame.columns]
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            summaries = executor.map(lambda job: job[1].from_series(data_frame[job[0]]), jobs)
+            return cls({col: summary for (col, _), summary in zip(jobs, summaries)}, len(data_frame))
+
+    @classmethod
+    def from_csv(cls, file_path=PATH_ORIGINAL_DATASET, chunksize=STREAM_CHUNKSIZE, clean=True, **kwargs):
+        """
+        Profiles a CSV file one chunk at a time, so memory is bounded by the chunk size.
+
+        Parameters:
+            file_path (str): Path of the CSV file.
+            chunksize (int): Number of rows read at a time.
+            clean (bool): Whether to apply the row-wise cleaning to each chunk first, to profile the
+                features of the cleaned dataset from the original one.
+            kwargs: Passed to from_frame.
+        """
+        from out_of_core import clean_chunk
+
+        profile = cls()
+        for chunk in pd.read_csv(file_path, chunksize=chunksize):
+            if clean:
+                chunk = clean_chunk(chunk, drop_location=False)
+            profile = profile.merge(cls.from_frame(chunk, **kwargs))
+        return profile
+
+    def merge(self, other):
+        summaries = dict(self.summaries)
+        for col, summary in other.summaries.items():
+            summaries[col] = summaries[col].merge(summary) if col in summaries else summary
+        return DatasetProfile(summaries, self.n_rows + other.n_rows)
+
+    def to_dict(self):
+        return {"n_rows": int(self.n_rows), "columns": {col: s.to_dict() for col, s in self.summaries.items()}}
+
+    def to_frame(self):
+        """
+        One row of statistics per column. Categorical frequencies beyond the top value are left out.
+        """
+        rows = {}
+        for col, stats in self.to_dict()["columns"].items():
+            stats = dict(stats)
+            stats.pop("frequencies", None)
+            for q, value in stats.pop("quantiles", {}).items():
+                stats[f"q{q}"] = value
+            rows[col] = stats
+        return pd.DataFrame.from_dict(rows, orient="index").rename_axis("column").reset_index()
+
+    def to_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+    def to_parquet(self, path):
+        """
+        Writes to_frame() as Parquet. Requires pyarrow or fastparquet.
+        """
+        frame = self.to_frame()
+        if "top" in frame:
+            frame["top"] = frame["top"].astype("string")  # Mixed None and str objects do not convert on their own.
+        frame.to_parquet(path, index=False)
@@ -0,0 +1,137 @@
+"""
+This file contains the grid-binned spatial hotspot index.
+
+Every collision is assigned to a cell of a fixed latitude/longitude grid with
+integer math on the whole column at once. The grid is anchored at (-90, -180),
+so a cell id never depends on the data and new rows can be added at any time.
+The index keeps the sorted ids of the non-empty cells and their counts broken
+down by severity, and answers top-K hotspot and bounding-box queries from them.
+"""
+
+import json
+
+import numpy as np
+import pandas as pd
+
+from constants import *
+
+
+class HotspotIndex:
+    """
+    Per-cell collision counts by severity.
+
+    Parameters:
+        cell_size (float): Size of a grid cell in degrees.
+        severities (list): Severity labels, in the order of the count columns.
+    """
+
+    def __init__(self, cell_size=HOTSPOT_CELL_SIZE, severities=None):
+        self.cell_size = cell_size
+        self.severities = list(severities or DATA_ORDINAL_MAPPINGS[TARGET_FEATURE])
+        self.n_columns = int(np.ceil(360 / cell_size))
+        self.cells = np.empty(0, dtype=np.int64)
+        self.counts = np.empty((0, len(self.severities)), dtype=np.uint32)
+
+    @classmethod
+    def from_frame(cls, data_frame, cell_size=HOTSPOT_CELL_SIZE):
+        """
+        Builds the index from the Lat, Long and severity columns of the cleaned DataFrame.
+        """
+        index = cls(cell_size)
+        index.update(data_frame)
+        return index
+
+    def cell_ids(self, lat, long):
+        """
+        Computes the grid cell id of each coordinate.
+        """
+        rows = np.floor((np.asarray(lat, dtype=float) + 90) / self.cell_size).astype(np.int64)
+        columns = np.floor((np.asarray(long, dtype=float) + 180) / self.cell_size).astype(np.int64)
+        return rows * self.n_columns + columns
+
+    def cell_centers(self, cells):
+        """
+        Computes the (lat, long) center of each cell id.
+        """
+        rows, columns = np.divmod(cells, self.n_columns)
+        return (rows + 0.5) * self.cell_size - 90, (columns + 0.5) * self.cell_size - 180
+
+    def update(self, data_frame):
+        """
+        Adds the collisions of a DataFrame to the index. Rows without coordinates are skipped.
+
+        Parameters:
+            data_frame (pd.DataFrame): Rows with Lat, Long and the severity (TARGET_FEATURE) labels.
+        """
+        rows = data_frame[["Lat", "Long", TARGET_FEATURE]].dropna()
+        severity = pd.Categorical(rows[TARGET_FEATURE], categories=self.severities).codes
+        if (severity < 0).any():
+            unknown = sorted(set(rows[TARGET_FEATURE][severity < 0]))
+            raise ValueError(f"Unknown severities {unknown}. Expected one of {self.severities}.")
+
+        # Count the new rows per cell and severity.
+        new_cells, inverse = np.unique(self.cell_ids(rows["Lat"], rows["Long"]), return_inverse=True)
+        new_counts = np.zeros((len(new_cells), len(self.severities)), dtype=np.uint32)
+        np.add.at(new_counts, (inverse.ravel(), severity), 1)
+
+        # Merge with the existing cells, keeping the ids sorted.
+        cells = np.union1d(self.cells, new_cells)
+        counts = np.zeros((len(cells), len(self.severities)), dtype=np.uint32)
+        counts[np.searchsorted(cells, self.cells)] += self.counts
+        counts[np.searchsorted(cells, new_cells)] += new_counts
+        self.cells, self.counts = cells, counts
+
+    def _frame(self, positions):
+        lat, long = self.cell_centers(self.cells[positions])
+        frame = pd.DataFrame(self.counts[positions].astype(np.int64), columns=self.severities)
+        frame.insert(0, "Long", long)
+        frame.insert(0, "Lat", lat)
+        frame.insert(0, "cell", self.cells[positions])
+        frame["total"] = frame[self.severities].sum(axis=1)
+        return frame
+
+    def top_k(self, k=10, severity=None):
+        """
+        Finds the cells with the most collisions.
+
+        Parameters:
+            k (int): Number of cells.
+            severity (str): Only count collisions of this severity, or every collision if None.
+
+        Returns:
+            pd.DataFrame: The cells, their centers and counts, in descending order.
+        """
+        totals = self.counts.sum(axis=1) if severity is None else self.counts[:, self.severities.index(severity)]
+        k = min(k, len(totals))
+        positions = np.argpartition(-totals.astype(np.int64), k - 1)[:k] if k else np.empty(0, dtype=np.intp)
+        positions = positions[np.argsort(-totals[positions].astype(np.int64), kind="stable")]
+        return self._frame(positions).reset_index(drop=True)
+
+    def bounding_box(self, lat_min, lat_max, long_min, long_max):
+        """
+        Finds the non-empty cells whose centers fall inside a bounding box.
+
+        Returns:
+            pd.DataFrame: The cells, their centers and counts.
+        """
+        lat, long = self.cell_centers(self.cells)
+        positions = np.flatnonzero((lat >= lat_min) & (lat <= lat_max) & (long >= long_min) & (long <= long_max))
+        return self._frame(positions)
+
+    def save(self, path=PATH_HOTSPOTS):
+        """
+        Writes the index to a compressed .npz file.
+        """
+        np.savez_compressed(path, cells=self.cells, counts=self.counts,
+                            metadata=json.dumps({"cell_size": self.cell_size, "severities": self.severities}))
+
+    @classmethod
+    def load(cls, path=PATH_HOTSPOTS):
+        """
+        Reads an index written by save.
+        """
+        with np.load(path) as data:
+            metadata = json.loads(str(data["metadata"]))
+            index = cls(metadata["cell_size"], metadata["severities"])
+            index.cells, index.counts = data["cells"], data["counts"]
+        return index
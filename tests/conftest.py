@@ -0,0 +1,16 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The modules live at the root of the repository and import each other by name.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def rng():
+    """
+    Seeded random generator for the synthetic data of a test.
+    """
+    return np.random.default_rng(0)
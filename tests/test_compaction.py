@@ -0,0 +1,81 @@
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip("sklearn")
+
+from sklearn.ensemble import RandomForestClassifier
+
+from compaction import FATAL_CODE, _compact_tree_state, compact_forest, compaction_report, save_compact_model
+from model import load_model
+
+
+@pytest.fixture
+def data(rng):
+    X = rng.normal(size=(600, 6)).astype(np.float32)
+    y = (X[:, 0] + X[:, 1] ** 2 + rng.normal(scale=0.5, size=600) > 1).astype(int) + (X[:, 2] > 1.2)
+    return X, y
+
+
+@pytest.fixture
+def forest(data):
+    return RandomForestClassifier(n_estimators=10, random_state=0).fit(*data)
+
+
+def test_thresholds_are_rounded_down_to_float32(forest):
+    state = forest.estimators_[0].tree_.__getstate__()
+    compact = _compact_tree_state(state)
+
+    thresholds = state["nodes"]["threshold"]
+    rounded = compact["nodes"]["threshold"]
+    assert rounded.dtype == np.float32
+    assert (rounded.astype(np.float64) <= thresholds).all()
+    # No float32 lies strictly between a rounded threshold and the original one.
+    assert (np.nextafter(rounded, np.float32(np.inf)).astype(np.float64) > thresholds).all()
+
+
+def test_compact_model_predicts_identically(tmp_path, forest, data):
+    X, _ = data
+    path = str(tmp_path / "compact.pkl")
+    save_compact_model(forest, path)
+    loaded = load_model(path)
+
+    np.testing.assert_array_equal(loaded.predict(X), forest.predict(X))
+    np.testing.assert_allclose(loaded.predict_proba(X), forest.predict_proba(X), atol=1e-6)
+    assert (tmp_path / "compact.pkl").stat().st_size < len(pickle.dumps(forest))
+
+
+def test_top_trees_and_distillation(forest, data):
+    X, y = data
+    top = compact_forest(forest, X, y, X, y, top_n_trees=3)
+    assert len(top.estimators_) == 3
+    assert len(forest.estimators_) == 10
+
+    student = compact_forest(forest, X, y, top_n_trees=5, max_depth=3, distill=True)
+    assert len(student.estimators_) == 5
+    assert max(tree.get_depth() for tree in student.estimators_) <= 3
+    np.testing.assert_array_equal(student.classes_, forest.classes_)
+
+
+def test_report_ratio_is_missing_where_the_full_model_scores_0(forest, data):
+    X, y = data
+    # Without Fatal rows, the Fatal recall of both models is 0.
+    rows = y != FATAL_CODE
+    report = compaction_report(forest, compact_forest(forest, X, y, X, y, top_n_trees=3), X[rows], y[rows])
+
+    assert report.loc["full", "Fatal recall"] == 0
+    assert np.isnan(report.loc["compact / full", "Fatal recall"])
+    assert np.isfinite(report.loc["compact / full"].drop("Fatal recall")).all()
+
+
+def test_failed_save_keeps_the_previous_model(tmp_path, forest):
+    path = str(tmp_path / "compact.pkl")
+    save_compact_model(forest, path)
+    saved = (tmp_path / "compact.pkl").read_bytes()
+
+    with pytest.raises((AttributeError, pickle.PicklingError)):
+        save_compact_model(lambda: None, path, float32=False)
+
+    assert (tmp_path / "compact.pkl").read_bytes() == saved
+    assert [file.name for file in tmp_path.iterdir()] == ["compact.pkl"]
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+from constants import *
+from cross_validation import fold_workers
+from feature_matrix import FeatureMatrix
+
+
+@pytest.fixture
+def matrix():
+    return FeatureMatrix(np.zeros((1000, 25), dtype=np.float32), np.zeros(1000, dtype=np.int64), {})
+
+
+def test_workers_are_capped_by_the_memory_budget(matrix):
+    fold_bytes = CROSS_VALIDATION_FOLD_COPIES * matrix.X.nbytes
+
+    assert fold_workers(matrix, n_splits=5, max_workers=4, memory_budget=100 * fold_bytes) == 4
+    assert fold_workers(matrix, n_splits=3, max_workers=4, memory_budget=100 * fold_bytes) == 3
+    assert fold_workers(matrix, n_splits=5, max_workers=4, memory_budget=2.5 * fold_bytes) == 2
+    assert fold_workers(matrix, n_splits=5, max_workers=4, memory_budget=0) == 1
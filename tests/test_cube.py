@@ -0,0 +1,88 @@
+import pandas as pd
+import pytest
+
+from cube import CollisionCube
+
+DIMENSIONS = ["year", "month", "hour", "weekday", "Light", "Road_Surface_Condition"]
+
+
+@pytest.fixture
+def frame(rng):
+    n = 500
+    return pd.DataFrame({
+        "year": rng.choice([2016, 2017, 2018], n),
+        "month": rng.integers(1, 13, n),
+        "day": rng.integers(1, 29, n),
+        "hour": rng.integers(0, 24, n),
+        "Light": rng.choice(["Dark", "Dawn", "Daylight"], n),
+        "Road_Surface_Condition": rng.choice(["Dry", "Wet", "Ice"], n),
+    })
+
+
+@pytest.fixture
+def cube(frame):
+    return CollisionCube.from_frame(frame, dimensions=DIMENSIONS)
+
+
+def test_rollups_are_time_each_categorical_by_time_and_categorical_pairs(cube):
+    assert set(cube.rollups) == {
+        ("year", "month", "hour", "weekday"),
+        ("year", "month", "hour", "weekday", "Light"),
+        ("year", "month", "hour", "weekday", "Road_Surface_Condition"),
+        ("Light", "Road_Surface_Condition"),
+    }
+    assert cube.rollups[("year", "month", "hour", "weekday")].shape == (3, 12, 24, 7)
+
+
+def test_query_matches_groupby(frame, cube):
+    expected = frame.groupby(["year", "Light"]).size()
+    result = cube.query(by=["year", "Light"])
+    assert result.to_dict() == expected.to_dict()
+    assert cube.query() == len(frame)
+
+    expected = frame.groupby(["Road_Surface_Condition", "Light"]).size()
+    assert cube.query(by=["Road_Surface_Condition", "Light"]).to_dict() == expected.to_dict()
+
+
+def test_query_returns_only_combinations_that_occur(frame, cube):
+    result = cube.query(by=["hour", "Light"], where={"Light": "Dark"})
+    assert (result > 0).all()
+    assert result.sum() == (frame["Light"] == "Dark").sum()
+
+
+def test_where_coerces_time_dimensions(frame, cube):
+    expected = (frame["year"] == 2017).sum()
+    assert cube.query(where={"year": "2017"}) == expected
+    assert cube.query(where={"year": [2017.0, 2017]}) == expected
+    assert cube.query(where={"year": 1990}) == 0
+
+    weekdays = pd.to_datetime(frame[["year", "month", "day"]]).dt.weekday
+    assert cube.query(where={"weekday": "Monday"}) == (weekdays == 0).sum()
+
+
+def test_where_raises_on_unknown_values(cube):
+    with pytest.raises(ValueError):
+        cube.query(where={"Light": "Darkk"})
+    with pytest.raises(ValueError):
+        cube.query(where={"year": "last year"})
+    with pytest.raises(ValueError):
+        cube.query(where={"Road": "Dry"})
+
+
+def test_query_raises_when_no_rollup_holds_the_dimensions(cube):
+    with pytest.raises(ValueError, match="No roll-up"):
+        cube.query(by=["year", "Light"], where={"Road_Surface_Condition": "Dry"})
+
+
+def test_crosstab_matches_pandas(frame, cube):
+    expected = pd.crosstab(frame["year"], frame["Light"])
+    result = cube.crosstab("year", "Light")
+    pd.testing.assert_frame_equal(result, expected, check_names=False, check_dtype=False)
+
+
+def test_save_and_load(tmp_path, cube):
+    path = str(tmp_path / "cube.npz")
+    cube.save(path)
+    loaded = CollisionCube.load(path)
+    assert loaded.query(by=["month"]).equals(cube.query(by=["month"]))
+    assert loaded.crosstab("Light", "Road_Surface_Condition").equals(cube.crosstab("Light", "Road_Surface_Condition"))
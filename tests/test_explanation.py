@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("shap")
+
+from sklearn.ensemble import HistGradientBoostingClassifier, RandomForestClassifier
+
+from explanation import ExplanationService
+
+
+@pytest.fixture
+def data(rng):
+    X = pd.DataFrame({"a": rng.integers(0, 3, 300), "b": rng.integers(0, 4, 300)}).astype(float)
+    y = (X["a"] + X["b"] > 3).astype(int)
+    return X, y
+
+
+def test_cache_counts_distinct_vectors(data):
+    X, y = data
+    service = ExplanationService(RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y))
+    batch = pd.concat([X.iloc[:5], X.iloc[:5]])
+    distinct = len(batch.drop_duplicates())
+
+    first = service.attributions(batch)
+    metrics = service.metrics()
+    assert metrics["misses"] == metrics["computations"] == distinct
+    assert metrics["hits"] == len(batch) - distinct
+
+    np.testing.assert_array_equal(service.attributions(batch), first)
+    metrics = service.metrics()
+    assert metrics["computations"] == distinct
+    assert metrics["hits"] == 2 * len(batch) - distinct
+
+
+def test_rejects_boosting_with_categorical_features(data):
+    X, y = data
+    model = HistGradientBoostingClassifier(categorical_features=[0], max_iter=5).fit(X, y)
+    with pytest.raises(ValueError):
+        ExplanationService(model)
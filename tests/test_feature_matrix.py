@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from constants import *
+from feature_matrix import load_feature_matrix, matrix_directory, save_feature_matrix
+
+
+def save_boosting_matrix(tmp_path):
+    X = pd.DataFrame({"Lat": [45.1, 45.2, 45.3], "Light": [0, 2, 1]})
+    y = pd.Series([2, 1, 2], name=TARGET_FEATURE)
+    directory = str(tmp_path / ENGINE_BOOSTING)
+    save_feature_matrix(X, y, directory, vocabularies={"Light": ["Dark", "Dawn", "Daylight"]}, engine=ENGINE_BOOSTING)
+    return X, y, directory
+
+
+def test_roundtrip(tmp_path):
+    X, y, directory = save_boosting_matrix(tmp_path)
+
+    matrix = load_feature_matrix(directory)
+    assert isinstance(matrix.X, np.memmap) and matrix.X.dtype == np.float32
+    np.testing.assert_array_equal(matrix.y, y)
+    pd.testing.assert_frame_equal(matrix.to_frame(), X.astype(np.float32))
+
+
+def test_each_engine_has_its_own_directory():
+    assert matrix_directory(ENGINE_FOREST) != matrix_directory(ENGINE_BOOSTING)
+
+
+def test_engine_check(tmp_path):
+    _, _, directory = save_boosting_matrix(tmp_path)
+
+    matrix = load_feature_matrix(directory)
+    matrix.check_engine(ENGINE_BOOSTING)
+    with pytest.raises(ValueError):
+        matrix.check_engine(ENGINE_FOREST)
@@ -0,0 +1,34 @@
+import pandas as pd
+
+from incremental import read_new_rows
+
+
+def write_rows(path, dates):
+    pd.DataFrame({"ObjectId": range(len(dates)), "Accident_Date": dates}).to_csv(path, index=False)
+
+
+def test_rows_appended_on_the_watermark_date_are_read(tmp_path):
+    path = str(tmp_path / "collisions.csv")
+    write_rows(path, ["2020/01/01", "2020/01/02"])
+    rows, watermark, ids = read_new_rows(path, chunksize=1)
+    assert len(rows) == 2 and watermark == "2020/01/02" and ids == [1]
+
+    # A row with the watermark date and a later one are appended.
+    write_rows(path, ["2020/01/01", "2020/01/02", "2020/01/02", "2020/01/03"])
+    rows, watermark, ids = read_new_rows(path, watermark, ids, chunksize=1)
+    assert rows["ObjectId"].tolist() == [2, 3]
+    assert watermark == "2020/01/03" and ids == [3]
+
+    rows, _, _ = read_new_rows(path, watermark, ids)
+    assert rows.empty
+
+
+def test_watermark_ids_accumulate_while_the_date_does_not_change(tmp_path):
+    path = str(tmp_path / "collisions.csv")
+    write_rows(path, ["2020/01/02", "2020/01/02"])
+    _, watermark, ids = read_new_rows(path)
+
+    write_rows(path, ["2020/01/02", "2020/01/02", "2020/01/02"])
+    rows, watermark, ids = read_new_rows(path, watermark, ids)
+    assert rows["ObjectId"].tolist() == [2]
+    assert watermark == "2020/01/02" and sorted(ids) == [0, 1, 2]
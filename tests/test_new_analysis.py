@@ -0,0 +1,22 @@
+import os
+
+import pandas as pd
+import pytest
+
+from new_analysis import feature_engineering, prepare_records
+
+
+def test_malformed_dates_and_times_become_missing():
+    df = feature_engineering(pd.DataFrame({"Accident_Date": ["2022/03/10", "2022/03", None],
+                                           "Accident_Time": ["6:20", "Unknown", "13:04"]}))
+
+    assert df.loc[0, ["year", "month", "day", "hour", "minute"]].tolist() == [2022, 3, 10, 6, 20]
+    assert df.loc[1, ["day", "hour", "minute"]].isna().all()
+    assert df.loc[2, ["year", "month", "day"]].isna().all()
+
+
+def test_unscorable_records_are_named():
+    records = pd.read_csv(os.path.join(os.path.dirname(__file__), "..", "Extras", "missing_rows.csv"))
+
+    with pytest.raises(ValueError, match="3 records .* at rows 0, 3, 8"):
+        prepare_records(records, model=None)
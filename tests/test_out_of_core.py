@@ -0,0 +1,15 @@
+import pytest
+
+from out_of_core import tree_groups
+
+
+@pytest.mark.parametrize("n_chunks, n_estimators", [(30, 10), (3, 10), (1, 100), (7, 7), (100, 3)])
+def test_forest_size_does_not_grow_with_the_number_of_chunks(n_chunks, n_estimators):
+    group_of_chunk, trees = tree_groups(n_chunks, n_estimators)
+
+    assert trees.sum() == n_estimators
+    assert (trees >= 1).all()
+    assert len(group_of_chunk) == n_chunks
+    # Groups are runs of consecutive chunks covering every group.
+    assert list(group_of_chunk) == sorted(group_of_chunk)
+    assert set(group_of_chunk) == set(range(len(trees)))
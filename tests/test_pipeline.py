@@ -0,0 +1,141 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline, Stage, code_dependencies
+
+# The stages log their runs to a file, since the globals a stage reads are part of its key.
+def log_call(log, name):
+    with open(log, "a") as f:
+        f.write(f"{name}\n")
+
+
+def calls(tmp_path):
+    with open(tmp_path / "calls.log") as f:
+        return f.read().split()
+
+
+def load_numbers(n, log):
+    log_call(log, "load")
+    return list(range(n))
+
+
+def write_total(numbers, path, log):
+    log_call(log, "total")
+    with open(path, "w") as f:
+        f.write(str(sum(numbers)))
+    return sum(numbers)
+
+
+def make_pipeline(tmp_path, n=3):
+    output, log = str(tmp_path / "total.txt"), str(tmp_path / "calls.log")
+    return Pipeline([
+        Stage("load", load_numbers, params={"n": n, "log": log}),
+        Stage("total", write_total, inputs=["load"], params={"path": output, "log": log}, outputs=[output]),
+    ], cache_dir=str(tmp_path / "cache"), max_workers=2), output
+
+
+def test_cached_stages_are_not_rerun(tmp_path):
+    pipeline, _ = make_pipeline(tmp_path)
+    assert pipeline.run()["total"] == 3
+    assert pipeline.run()["total"] == 3
+    assert calls(tmp_path) == ["load", "total"]
+
+
+def test_changed_params_change_the_keys_downstream(tmp_path):
+    pipeline, _ = make_pipeline(tmp_path, n=3)
+    other, _ = make_pipeline(tmp_path, n=4)
+    keys, other_keys = pipeline.keys(["load", "total"]), other.keys(["load", "total"])
+    assert keys["load"] != other_keys["load"]
+    assert keys["total"] != other_keys["total"]
+
+
+def test_deleted_or_overwritten_outputs_rerun_the_stage(tmp_path):
+    pipeline, output = make_pipeline(tmp_path)
+    pipeline.run()
+
+    os.remove(output)
+    pipeline.run()
+    assert calls(tmp_path) == ["load", "total", "total"]  # The cached input is loaded, not rerun.
+    assert os.path.exists(output)
+
+    with open(output, "w") as f:
+        f.write("overwritten")
+    pipeline.run()
+    assert calls(tmp_path)[-1] == "total"
+
+
+def test_code_dependencies_follow_called_and_imported_repository_code():
+    from new_analysis import matrix_stage, train_stage
+
+    # Imported inside the stage functions.
+    assert "feature_matrix.py" in code_dependencies(matrix_stage)
+    assert "model.py" in code_dependencies(train_stage)
+
+
+def test_code_dependencies_include_constants_by_value():
+    import new_analysis
+
+    dependencies = code_dependencies(new_analysis.hotspots_stage)
+    assert dependencies["new_analysis.PATH_HOTSPOTS"] == repr(new_analysis.PATH_HOTSPOTS)
+
+
+def start_modelling(log):
+    time.sleep(0.2)
+    return log
+
+
+def finish_modelling(log, started):
+    started.set()
+    return log
+
+
+def draw(log, started):
+    # Waits for a stage that only becomes ready after this one started.
+    return started.wait(timeout=5)
+
+
+def test_stages_start_while_a_plot_stage_runs(tmp_path):
+    started = threading.Event()
+    log = str(tmp_path / "calls.log")
+    pipeline = Pipeline([
+        Stage("load", load_numbers, params={"n": 3, "log": log}, cache=False),
+        Stage("plot", draw, inputs=["load"], params={"started": started}, plots=True, cache=False),
+        Stage("split", start_modelling, inputs=["load"], cache=False),
+        Stage("train", finish_modelling, inputs=["split"], params={"started": started}, cache=False),
+    ], cache_dir=str(tmp_path / "cache"), max_workers=2)
+
+    assert pipeline.run(["plot", "train"])["plot"]
+
+
+def fail(numbers):
+    raise RuntimeError("stage failed")
+
+
+def test_a_failing_stage_stops_the_run(tmp_path):
+    pipeline = Pipeline([
+        Stage("load", load_numbers, params={"n": 3, "log": str(tmp_path / "calls.log")}),
+        Stage("fail", fail, inputs=["load"]),
+    ], cache_dir=str(tmp_path / "cache"))
+
+    with pytest.raises(RuntimeError):
+        pipeline.run()
+
+
+def test_stale_results_are_pruned(tmp_path):
+    for n in range(4):
+        make_pipeline(tmp_path, n=n)[0].run()
+
+    cached = sorted(os.listdir(tmp_path / "cache"))
+    assert len([name for name in cached if name.startswith("load-") and name.endswith(".pkl")]) == 2
+    assert len([name for name in cached if name.startswith("total-") and name.endswith(".outputs.json")]) == 2
+
+    # The current key is always kept, even with cache_keep=1.
+    pipeline, _ = make_pipeline(tmp_path, n=1)
+    pipeline.cache_keep = 1
+    pipeline.run()
+    key = pipeline.keys(["load"])["load"]
+    kept = sorted(name for name in os.listdir(tmp_path / "cache") if name.startswith("load-"))
+    assert kept == [f"load-{key[:16]}.outputs.json", f"load-{key[:16]}.pkl"]
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+from profiling import CategoricalSummary, DatasetProfile, NumericSummary, QuantileSketch
+
+
+def merged(summary_class, series, n_chunks, **kwargs):
+    summary = None
+    for rows in np.array_split(np.arange(len(series)), n_chunks):
+        chunk = summary_class.from_series(series.iloc[rows], **kwargs)
+        summary = chunk if summary is None else summary.merge(chunk)
+    return summary
+
+
+def test_numeric_merge_matches_one_pass(rng):
+    series = pd.Series(rng.normal(10, 3, 5000))
+    series[::50] = np.nan
+    stats = merged(NumericSummary, series, 9).to_dict()
+
+    assert stats["count"] == series.notna().sum()
+    assert stats["missing"] == series.isna().sum()
+    assert np.isclose(stats["mean"], series.mean())
+    assert np.isclose(stats["std"], series.std())
+    assert stats["min"] == series.min() and stats["max"] == series.max()
+
+
+def test_quantile_sketch_is_exact_below_its_size_and_close_above(rng):
+    values = rng.random(20_000)
+    assert QuantileSketch.from_values(values[:500]).quantile(0.5) == np.sort(values[:500])[249]
+
+    sketch = QuantileSketch.from_values(values[:10_000], size=200).merge(
+        QuantileSketch.from_values(values[10_000:], size=200))
+    assert len(sketch.values) == 200
+    assert abs(sketch.quantile(0.25) - np.quantile(values, 0.25)) < 0.02
+
+
+def test_categorical_merge_is_exact_below_the_limit():
+    series = pd.Series(list("aaabbc") * 100 + [None] * 7)
+    stats = merged(CategoricalSummary, series, 5).to_dict()
+
+    assert stats["frequencies"] == {"a": 300, "b": 200, "c": 100}
+    assert stats["missing"] == 7
+    assert stats["unique"] == 3 and stats["frequency_error"] == 0
+
+
+def test_categorical_counts_stay_bounded_and_keep_frequent_values(rng):
+    values = np.concatenate([rng.integers(0, 100_000, 20_000).astype(str), ["HOT"] * 2000])
+    rng.shuffle(values)
+    summary = merged(CategoricalSummary, pd.Series(values), 10, size=50)
+    stats = summary.to_dict()
+
+    assert len(summary.frequencies) <= 50
+    assert stats["count"] == len(values)
+    assert stats["top"] == "HOT"
+    assert 2000 - stats["frequency_error"] <= stats["freq"] <= 2000
+    assert stats["frequency_error"] <= len(values) / 51
+    assert stats["unique"] is None
+
+
+def test_dataset_profile_merge():
+    frame = pd.DataFrame({"Lat": np.arange(100, dtype=float), "Light": ["Dark", "Daylight"] * 50})
+    profile = DatasetProfile.from_frame(frame.iloc[:30], numerical=["Lat"], categorical=["Light"]).merge(
+        DatasetProfile.from_frame(frame.iloc[30:], numerical=["Lat"], categorical=["Light"]))
+    stats = profile.to_dict()
+
+    assert stats["n_rows"] == 100
+    assert np.isclose(stats["columns"]["Lat"]["mean"], 49.5)
+    assert stats["columns"]["Light"]["frequencies"] == {"Dark": 50, "Daylight": 50}
+
+
+def test_summary_statistics_are_rendered_from_the_profile(capsys):
+    from visualization import summary_statistics
+
+    frame = pd.DataFrame({"Lat": np.arange(100, dtype=float), "Light": ["Dark", "Daylight"] * 50})
+    summary_statistics(frame, ["Lat", "Light"])
+    output = capsys.readouterr().out
+
+    assert "q0.5" in output and "frequency_error" in output
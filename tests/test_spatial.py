@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from constants import *
+from spatial import HotspotIndex
+
+SEVERITIES = list(DATA_ORDINAL_MAPPINGS[TARGET_FEATURE])
+
+
+@pytest.fixture
+def frame(rng):
+    n = 1000
+    return pd.DataFrame({
+        "Lat": 45.3 + rng.random(n) * 0.1,
+        "Long": -75.8 + rng.random(n) * 0.1,
+        TARGET_FEATURE: rng.choice(SEVERITIES, n),
+    })
+
+
+def test_update_in_chunks_matches_one_pass(frame):
+    whole = HotspotIndex.from_frame(frame)
+    chunked = HotspotIndex()
+    for rows in np.array_split(np.arange(len(frame)), 7):
+        chunked.update(frame.iloc[rows])
+
+    np.testing.assert_array_equal(chunked.cells, whole.cells)
+    np.testing.assert_array_equal(chunked.counts, whole.counts)
+    assert whole.counts.sum() == len(frame)
+
+
+def test_update_skips_rows_without_coordinates(frame):
+    frame.loc[:9, "Lat"] = np.nan
+    assert HotspotIndex.from_frame(frame).counts.sum() == len(frame) - 10
+
+
+def test_update_raises_on_unknown_severity(frame):
+    frame.loc[0, TARGET_FEATURE] = "Unknown"
+    with pytest.raises(ValueError):
+        HotspotIndex.from_frame(frame)
+
+
+def test_top_k_is_sorted_and_consistent(frame):
+    index = HotspotIndex.from_frame(frame)
+    top = index.top_k(5)
+    assert len(top) == 5
+    assert top["total"].is_monotonic_decreasing
+    assert top["total"].iloc[0] == index.counts.sum(axis=1).max()
+
+    severity = SEVERITIES[0]
+    assert index.top_k(1, severity=severity)[severity].iloc[0] == index.counts[:, 0].max()
+
+
+def test_save_and_load(tmp_path, frame):
+    index = HotspotIndex.from_frame(frame)
+    path = str(tmp_path / "hotspots.npz")
+    index.save(path)
+    loaded = HotspotIndex.load(path)
+    np.testing.assert_array_equal(loaded.counts, index.counts)
+    assert loaded.cell_size == index.cell_size
@@ -1,33 +1,41 @@
 import textwrap
 
 from helpers import *
-import pandas as pd
+from cube import CollisionCube
+from profiling import DatasetProfile
+from spatial import HotspotIndex
 import seaborn as sns
 import matplotlib.pyplot as plt
-from mpl_toolkits.basemap import Basemap
+from map_cache import draw_map, map_bounds
 
 
-def summary_statistics(data_frame, features: list = DATA_FINAL_FEATURES):
+def summary_statistics(data_frame, features: list = DATA_FINAL_FEATURES, cube: CollisionCube = None):
     """
-    Summary stats for data frame.
+    Summary stats for data frame, from the one pass profile of each feature.
     :param data_frame: the data frame.
     :param features: features to summarize.
+    :param cube: aggregation cube the categorical frequencies are read from, if given.
     :return:
     """
+    numerical = [feature for feature in features if feature in DATA_NUMERICAL_FEATURES]
+    categorical = [feature for feature in features if feature not in DATA_NUMERICAL_FEATURES]
+    profile = DatasetProfile.from_frame(data_frame, numerical=numerical, categorical=categorical).to_frame()
+    profile = profile.set_index("column")
 
     def func():
         for feature in features:
-            print(data_frame[feature].describe(include="all"))
+            print(profile.loc[feature].dropna().rename(feature))
             if feature in DATA_CATEGORICAL_FEATURES:
-                print(data_frame[feature].value_counts())
+                print(cube.value_counts(feature) if cube is not None else data_frame[feature].value_counts())
             print_divider()
 
     run_section(TITLE_SUMMARY_STATISTICS, func)
 
 
-def visualize_bar_plots(data_frame, features: list[str] = DATA_CATEGORICAL_FEATURES, stack_plots: bool = False):
+def visualize_bar_plots(cube: CollisionCube, features: list[str] = DATA_CATEGORICAL_FEATURES,
+                        stack_plots: bool = False):
     """
-    Creates bar plots of categorical features.
+    Creates bar plots of categorical features from the aggregation cube.
     """
     if stack_plots:
         # Create stacked plots for each pair of features.
@@ -39,7 +47,7 @@ def visualize_bar_plots(data_frame, features: list[str] = DATA_CATEGORICAL_FEATU
                 if feature1 == feature2:
                     continue
 
-                crosstab_result = pd.crosstab(data_frame[feature1], data_frame[feature2])
+                crosstab_result = cube.crosstab(feature1, feature2)
 
                 # Sort the columns of crosstab_result based on their total sum in descending order
                 crosstab_result = crosstab_result[sorted(crosstab_result.columns,
@@ -70,17 +78,14 @@ def visualize_bar_plots(data_frame, features: list[str] = DATA_CATEGORICAL_FEATU
     else:
         for feature in features:
             # Count the occurrences of each category and sort them.
-            sorted_counts = data_frame[feature].value_counts().sort_values(ascending=False)
-
-            # Convert the sorted index to a categorical type for ordering in the plot.
-            temp_feature = feature + "_temp"
-            data_frame[temp_feature] = pd.Categorical(data_frame[feature], categories=sorted_counts.index, ordered=True)
+            sorted_counts = cube.value_counts(feature)
+            labels = [str(label) for label in sorted_counts.index]
 
             # Create the count plot.
             feature_name = feature.replace("_", " ")
             title = f"Bar Plot of Accidents by {feature_name}"
             plt.figure(figsize=(10, 6))  # Set figure size for better resolution
-            sns.countplot(data=data_frame, x=temp_feature, order=sorted_counts.index)
+            sns.barplot(x=labels, y=sorted_counts.values, order=labels)
             plt.title(title)
             plt.xlabel(feature_name)
             plt.ylabel("Number of Accidents")
@@ -91,12 +96,11 @@ def visualize_bar_plots(data_frame, features: list[str] = DATA_CATEGORICAL_FEATU
                         bbox_inches="tight")
             plt.close()
 
-            data_frame.drop(columns=[temp_feature], inplace=True)
-
 
-def visualize_geographic_data(data_frame):
+def visualize_geographic_data(data_frame, hotspots: HotspotIndex = None):
     """
     Scatter Plots for geographical data.
+    The top locations are read from the hotspot index, built from the data frame if not given.
     """
 
     """ 
@@ -118,18 +122,13 @@ def visualize_geographic_data(data_frame):
     """
     plt.figure(figsize=(10, 6))
 
-    # Create a Basemap instance with Mercator projection
+    # Mercator projection and background (coastlines, countries and states), cached on disk by bounds.
     filtered_data = data_frame[(data_frame["Lat"] > 43) & (data_frame["Long"] > -77)]
-    m = Basemap(projection='merc', llcrnrlat=min(filtered_data["Lat"]), urcrnrlat=max(filtered_data["Lat"]),
-                llcrnrlon=min(filtered_data["Long"]), urcrnrlon=max(filtered_data["Long"]), resolution='i')
-    # Draw map features (optional)
-    m.drawcoastlines()
-    m.drawcountries()
-    m.drawstates()
+    bounds = map_bounds(filtered_data["Lat"], filtered_data["Long"])
     # Convert longitude and latitude to map projection coordinates
-    x, y = m(data_frame["Long"].values, data_frame["Lat"].values)
+    _, x, y = draw_map(data_frame["Lat"].values, data_frame["Long"].values, MAP_RESOLUTION, bounds)
     # Plot scatter on the map (on top of the background)
-    m.scatter(x, y, color='red', edgecolor='black', linewidth=1, alpha=0.5, marker='o')
+    plt.scatter(x, y, color='red', edgecolor='black', linewidth=1, alpha=0.5, marker='o')
 
     title = "Map of Latitude vs Longitude of Accidents"
     plt.title(title)
@@ -154,22 +153,24 @@ def visualize_geographic_data(data_frame):
     plt.close()
 
     """
-        Bar Plot of the Top accident locations.
+        Bar Plot of the Top accident locations, as grid cells of the hotspot index.
     """
+    if hotspots is None:
+        hotspots = HotspotIndex.from_frame(data_frame)
     N = 10  # Number of locations.
-    sorted_counts = data_frame[FEATURE_LOCATION].value_counts().sort_values(ascending=False)  # Count the occurrences and sort them.
-    top_locations = sorted_counts.head(N)  # Extract the top N locations.
-    top_indexes = top_locations.index.tolist()
+    top_locations = hotspots.top_k(N)  # Extract the top N grid cells.
+    top_indexes = [f"{lat:.4f}, {long:.4f}" for lat, long in zip(top_locations["Lat"], top_locations["Long"])]
     plt.figure(figsize=(N, 8))
     sns.barplot(
         x=top_indexes,
-        y=top_locations.values,
+        y=top_locations["total"].values,
         legend="full",
         hue=top_indexes,  # Add this to enable legend coloring
         dodge=False,  # Prevent separation of bars due to hue
         palette=f"tab{N}"  # Choose a colormap
     )
-    plt.legend(title="Locations", bbox_to_anchor=(1.05, 1), loc='upper left')
+    plt.legend(title=f"Grid Cell Centers (Lat, Long), {hotspots.cell_size}\u00b0 cells", bbox_to_anchor=(1.05, 1),
+               loc='upper left')
     title = f"Bar Plot of Accidents at Top {N} Locations"
     plt.title(title)
     plt.xlabel(FEATURE_LOCATION)
@@ -181,26 +182,25 @@ def visualize_geographic_data(data_frame):
     data_frame.drop(columns=[FEATURE_LOCATION], inplace=True)  # Drop the Location column.
 
 
-def visualize_time_plots(data_frame):
+def visualize_time_plots(cube: CollisionCube):
     """
-    Bar plots for times.
+    Bar plots for times, from the aggregation cube.
     """
     features = ["year", "month", "hour"]
     for feature in features:
         plt.figure(figsize=(10, 6))
 
-        # Establish numerical ordering.
-        if feature == "hour":
-            ordering = [str(n) for n in sorted([int(x) for x in data_frame[feature].unique()])]
-        else:
-            ordering = sorted(data_frame[feature].unique())
+        # The cube stores times as integers, so its order is already numerical.
+        counts = cube.query(by=[feature])
 
         # If the feature is "month", map it to the month names.
         if feature == "month":
-            data_frame["month_name"] = data_frame["month"].map(MONTH_MAPPING)
-            sns.countplot(x="month_name", data=data_frame, order=list(MONTH_MAPPING.values()))
+            counts = counts.reindex(range(1, 13), fill_value=0)
+            labels = list(MONTH_MAPPING.values())
         else:
-            sns.countplot(x=feature, data=data_frame, order=ordering)
+            counts = counts[counts > 0]
+            labels = [str(label) for label in counts.index]
+        sns.barplot(x=labels, y=counts.values, order=labels)
 
         title = f"Bar Plot of Accidents by {feature.capitalize()}"
         plt.title(title)
@@ -210,17 +210,18 @@ def visualize_time_plots(data_frame):
         plt.savefig(f"{PATH_VISUALIZATIONS}/Bar Plots/{title}{VISUALIZATIONS_FILE_TYPE}", dpi=300, bbox_inches="tight")
         plt.close()
 
-        if feature == "month":
-            data_frame.drop(columns=["month_name"], inplace=True)
-
 
-def visualize(data_frame):
+def visualize(data_frame, stack_plots: bool = True, cube: CollisionCube = None, hotspots: HotspotIndex = None):
     """
     Produce statistics summary and visualization files.
+    The counting plots are rendered from the aggregation cube, built from the data frame if not given.
     """
     print("<<<Starting Visualization>>>")
-    summary_statistics(data_frame, DATA_FINAL_FEATURES)
-    visualize_geographic_data(data_frame)
-    visualize_time_plots(data_frame)
-    visualize_bar_plots(data_frame, DATA_CATEGORICAL_FEATURES, stack_plots=False)
-    visualize_bar_plots(data_frame, DATA_CATEGORICAL_FEATURES, stack_plots=True)
+    if cube is None:
+        cube = CollisionCube.from_frame(data_frame)
+    summary_statistics(data_frame, DATA_FINAL_FEATURES, cube)
+    visualize_geographic_data(data_frame, hotspots)
+    visualize_time_plots(cube)
+    visualize_bar_plots(cube, DATA_CATEGORICAL_FEATURES, stack_plots=False)
+    if stack_plots:
+        visualize_bar_plots(cube, DATA_CATEGORICAL_FEATURES, stack_plots=True)